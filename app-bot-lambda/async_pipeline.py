@@ -0,0 +1,120 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import document_urls
+import downloader
+import lambda_helpers as helper
+import utils
+
+logger = logging.getLogger()
+
+# Pipeline settings. Adjust as necessary.
+# Most documents evaluated per application, all read concurrently
+MAX_DOCUMENTS = document_urls.MAX_DOCUMENTS
+# Threads for blocking stages: a download, a Textract call and a parse per document
+EXECUTOR_WORKERS = MAX_DOCUMENTS * 3
+
+_loop = None
+
+
+# The event loop lives at module scope so warm invocations reuse it, along
+# with its executor threads
+def get_loop():
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        _loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS))
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def run(coroutine):
+    return get_loop().run_until_complete(coroutine)
+
+
+# Runs a blocking stage on the loop's executor. boto3 and urllib3 release the
+# GIL while waiting on the network, so trp parsing of one document runs while
+# the others are still downloading or being analyzed.
+async def offload(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+
+async def download(urlfile, budget=None):
+    timeout = downloader.TOTAL_TIMEOUT
+    if budget is not None:
+        timeout = min(timeout, budget.time_for('download'))
+    return await offload(helper.get_urlfile, urlfile, timeout)
+
+
+async def analyze(urlfile_download, budget=None, prefetch_wait=0, urlfile=None, reader=None):
+    timeout = None
+    if budget is not None:
+        budget.check('analyze')
+        timeout = budget.time_for('analyze')
+    return await offload(utils.analyze, urlfile_download.data, prefetch_wait, urlfile_download.digest, timeout,
+        urlfile=urlfile, reader=reader)
+
+
+async def parse(response, reader=None):
+    return await offload(utils.read_document, response, reader=reader)
+
+
+# Download, Textract and extraction for one document. Returns (key, result)
+# where result is an extraction.ExtractionResult, or the utils.Referral or
+# DownloadError explaining why the document cannot be used. Running out of
+# budget raises time_budget.BudgetExceeded (or textract_async.AnalysisTimeout).
+async def read_urlfile(urlfile, budget=None, prefetch_wait=0):
+    try:
+        urlfile_download = await download(urlfile, budget)
+    except downloader.DownloadError as e:
+        logger.error('Document download error: %s, %s', urlfile, str(e))
+        return urlfile, e
+    try:
+        # Pages of a multi-page analysis are parsed as they arrive
+        reader = utils.DocumentReader()
+        response = await analyze(urlfile_download, budget, prefetch_wait, urlfile, reader)
+        return urlfile_download.digest, await parse(response, reader)
+    except utils.Referral as e:
+        return urlfile_download.digest, e
+
+
+# Reads all documents concurrently, so the wall-clock time is that of the
+# slowest one, and returns one result per distinct document. Documents beyond
+# MAX_DOCUMENTS are not read and are returned as utils.Skipped, so they still
+# count against a denial. The first timeout cancels the remaining documents
+# and is raised, so the caller can defer the whole application.
+async def read_urlfiles(urlfiles, budget=None, prefetch_wait=0):
+    skipped = urlfiles[MAX_DOCUMENTS:]
+    if skipped:
+        logger.warning('Evaluating %s of %s documents', MAX_DOCUMENTS, len(urlfiles))
+    tasks = [asyncio.ensure_future(read_urlfile(urlfile, budget, prefetch_wait)) for urlfile in urlfiles[:MAX_DOCUMENTS]]
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    errors = [task.exception() for task in tasks if task in done and task.exception()]
+    if errors:
+        raise errors[0]
+    documents = {}
+    for task in tasks:
+        key, document = task.result()
+        documents.setdefault(key, document)
+    return list(documents.values()) + [utils.Skipped(
+        "I can only review {} documents at a time. I'll transfer you to an agent to review the rest.".format(MAX_DOCUMENTS))
+        for urlfile in skipped]
@@ -0,0 +1,200 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger()
+
+# Decision rule settings. Adjust as necessary.
+# DECISION_RULES_URI is a local path or an s3://bucket/key URI, so the policy
+# can be changed without a code deployment.
+RULES_URI = os.environ.get('DECISION_RULES_URI',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'decision_rules.json'))
+
+DENIED = 0
+APPROVED = 1
+REFERRED = 2
+DECISIONS = ("Denied", "Approved", "Referred")
+
+# Rule keys, all optional. Amounts and income are annual dollars, confidence
+# is the Textract confidence (0-100) of the extracted wages.
+RULE_KEYS = {
+    "incomeMultiple",   # income * incomeMultiple must exceed the loan amount
+    "minAmount",
+    "maxAmount",
+    "minIncome",
+    "maxDebtToIncome",  # yearly repayment / income, needs termYears
+    "termYears",
+    "annualRate",
+    "minConfidence"     # below it the application is referred to an agent
+}
+
+
+class RuleError(Exception):
+    pass
+
+
+# A rule set reduced to a handful of numbers, so evaluating an application is
+# a few comparisons with no dictionary lookups or arithmetic on the rule itself
+class CompiledRule:
+    __slots__ = ("name", "income_multiple", "min_amount", "max_amount", "min_income",
+        "repayment_factor", "min_confidence")
+
+    def __init__(self, name, spec):
+        unknown = set(spec) - RULE_KEYS
+        if unknown:
+            raise RuleError("Unknown keys in rule {}: {}".format(name, ", ".join(sorted(unknown))))
+        self.name = name
+        self.income_multiple = spec.get("incomeMultiple", None)
+        self.min_amount = spec.get("minAmount", None)
+        self.max_amount = spec.get("maxAmount", None)
+        self.min_income = spec.get("minIncome", None)
+        self.min_confidence = spec.get("minConfidence", None)
+
+        # Debt-to-income becomes "amount * repayment_factor <= income"
+        self.repayment_factor = None
+        max_debt_to_income = spec.get("maxDebtToIncome", None)
+        if max_debt_to_income is not None:
+            if not spec.get("termYears", None) or max_debt_to_income <= 0:
+                raise RuleError("Rule {} needs termYears and a positive maxDebtToIncome".format(name))
+            self.repayment_factor = annual_repayment(spec["termYears"], spec.get("annualRate", 0)) / max_debt_to_income
+
+    # Returns (decision code, reason)
+    def evaluate(self, amount, income, confidence=None):
+        if income is None:
+            return REFERRED, "income unknown"
+        if self.min_confidence is not None and confidence is not None and confidence < self.min_confidence:
+            return REFERRED, "confidence {:.1f} below {}".format(confidence, self.min_confidence)
+        if self.min_amount is not None and amount < self.min_amount:
+            return DENIED, "amount below {}".format(self.min_amount)
+        if self.max_amount is not None and amount > self.max_amount:
+            return DENIED, "amount above {}".format(self.max_amount)
+        if self.min_income is not None and income < self.min_income:
+            return DENIED, "income below {}".format(self.min_income)
+        if self.income_multiple is not None and not income * self.income_multiple > amount:
+            return DENIED, "amount exceeds {} times income".format(self.income_multiple)
+        if self.repayment_factor is not None and amount * self.repayment_factor > income:
+            return DENIED, "debt-to-income too high"
+        return APPROVED, "all checks passed"
+
+    # Same checks over NumPy arrays; a NaN income or confidence means unknown
+    def evaluate_batch(self, np, amounts, incomes, confidences=None):
+        codes = np.full(amounts.shape, APPROVED, dtype=np.int8)
+        denied = np.zeros(amounts.shape, dtype=bool)
+        if self.min_amount is not None:
+            denied |= amounts < self.min_amount
+        if self.max_amount is not None:
+            denied |= amounts > self.max_amount
+        if self.min_income is not None:
+            denied |= incomes < self.min_income
+        if self.income_multiple is not None:
+            denied |= ~(incomes * self.income_multiple > amounts)
+        if self.repayment_factor is not None:
+            denied |= amounts * self.repayment_factor > incomes
+        codes[denied] = DENIED
+
+        referred = np.isnan(incomes)
+        if self.min_confidence is not None and confidences is not None:
+            referred |= confidences < self.min_confidence
+        codes[referred] = REFERRED
+        return codes
+
+
+# Yearly repayment per dollar borrowed for a fully amortizing monthly loan
+def annual_repayment(term_years, annual_rate):
+    months = term_years * 12
+    if not annual_rate:
+        return 1.0 / term_years
+    rate = annual_rate / 12
+    return 12 * rate / (1 - (1 + rate) ** -months)
+
+
+def load_rules(uri=None):
+    uri = uri or RULES_URI
+    if uri.startswith("s3://"):
+        import aws_clients
+        bucket, _, key = uri[5:].partition("/")
+        body = aws_clients.get_client('s3').get_object(Bucket=bucket, Key=key)['Body'].read()
+        return json.loads(body)
+    with open(uri, 'rt') as rules_file:
+        return json.load(rules_file)
+
+
+# Each loan type inherits the default rule and overrides individual keys
+def compile_rules(spec):
+    default = spec.get("default", {})
+    rules = {None: CompiledRule("default", default)}
+    for loan_type, overrides in spec.get("loanTypes", {}).items():
+        merged = dict(default)
+        merged.update(overrides)
+        rules[loan_type.lower()] = CompiledRule(loan_type, merged)
+    return rules
+
+
+_rules = None
+_rules_lock = threading.Lock()
+
+
+# Rules are loaded and compiled once per container
+def get_rules():
+    global _rules
+    if _rules is None:
+        with _rules_lock:
+            if _rules is None:
+                _rules = compile_rules(load_rules())
+                logger.info('Decision rules compiled: %s', ", ".join(rule.name for rule in _rules.values()))
+    return _rules
+
+
+def rule_for(loan_type=None):
+    rules = get_rules()
+    return rules.get(loan_type.lower() if loan_type else None, rules[None])
+
+
+# Returns (decision, reason) for one application
+def decide(amount, income, loan_type=None, confidence=None):
+    rule = rule_for(loan_type)
+    code, reason = rule.evaluate(amount, income, confidence)
+    return DECISIONS[code], "{}: {}".format(rule.name, reason)
+
+
+# Scores many applications in one vectorized pass and returns an int8 array
+# of decision codes (index into DECISIONS). loan_types is one loan type for
+# every application or one per application. NumPy is only needed here, so the
+# bot itself does not have to package it.
+def score_batch(amounts, incomes, loan_types=None, confidences=None):
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("score_batch requires numpy")
+    amounts = np.asarray(amounts, dtype=float)
+    incomes = np.asarray(incomes, dtype=float)
+    if confidences is not None:
+        confidences = np.asarray(confidences, dtype=float)
+
+    if loan_types is None or isinstance(loan_types, str):
+        return rule_for(loan_types).evaluate_batch(np, amounts, incomes, confidences)
+
+    loan_types = np.asarray(loan_types, dtype=object)
+    codes = np.empty(amounts.shape, dtype=np.int8)
+    for loan_type in set(loan_types.tolist()):
+        mask = loan_types == loan_type
+        codes[mask] = rule_for(loan_type).evaluate_batch(np, amounts[mask], incomes[mask],
+            None if confidences is None else confidences[mask])
+    return codes
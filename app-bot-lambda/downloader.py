@@ -0,0 +1,108 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import hashlib
+import logging
+import os
+import time
+import urllib3
+
+logger = logging.getLogger()
+
+# Download settings. Adjust as necessary. Timeouts are in seconds.
+CONNECT_TIMEOUT = float(os.environ.get('DOWNLOAD_CONNECT_TIMEOUT', 2))
+READ_TIMEOUT = float(os.environ.get('DOWNLOAD_READ_TIMEOUT', 5))
+TOTAL_TIMEOUT = float(os.environ.get('DOWNLOAD_TOTAL_TIMEOUT', 10))
+MAX_DOCUMENT_BYTES = int(os.environ.get('DOWNLOAD_MAX_BYTES', 15 * 1024 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+# Connection pool shared across warm invocations (urllib3 ships with botocore)
+_pool = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=4,
+    timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT),
+    retries=urllib3.Retry(total=2, connect=2, read=0, redirect=3, backoff_factor=0.2)
+)
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DocumentTooLarge(DownloadError):
+    pass
+
+
+class Download:
+    def __init__(self, data, digest, content_type):
+        self.data = data
+        self.digest = digest
+        self.content_type = content_type
+
+
+# Streams url into a single bytearray. With a Content-Length the buffer is
+# allocated once at its final size and filled in place; otherwise it doubles as
+# needed and is trimmed at the end. The SHA-256 of the content is computed while
+# reading so it can key the Textract cache without another pass.
+def download(url, max_bytes=MAX_DOCUMENT_BYTES, total_timeout=TOTAL_TIMEOUT):
+    deadline = time.monotonic() + total_timeout
+    try:
+        response = _pool.request('GET', url, preload_content=False, headers={'Accept-Encoding': 'identity'})
+    except urllib3.exceptions.HTTPError as e:
+        raise DownloadError("Download failed: {}".format(str(e)))
+
+    try:
+        if response.status != 200:
+            raise DownloadError("Download failed with HTTP status {}".format(response.status))
+
+        length = response.headers.get('Content-Length', None)
+        length = int(length) if length and length.isdigit() else None
+        if length is not None and length > max_bytes:
+            raise DocumentTooLarge("Document is {} bytes, limit is {}".format(length, max_bytes))
+
+        digest = hashlib.sha256()
+        buffer = bytearray(length if length is not None else min(CHUNK_SIZE, max_bytes + 1))
+        view = memoryview(buffer)
+        position = 0
+        while True:
+            if position == len(buffer):
+                if length is not None:
+                    break
+                # Unknown size: double the buffer (the view must be released first)
+                view.release()
+                buffer.extend(bytes(min(len(buffer), max_bytes + 1 - len(buffer))))
+                view = memoryview(buffer)
+            count = response.readinto(view[position:position + CHUNK_SIZE])
+            if not count:
+                break
+            digest.update(view[position:position + count])
+            position += count
+            if position > max_bytes:
+                raise DocumentTooLarge("Document exceeds {} bytes".format(max_bytes))
+            if time.monotonic() > deadline:
+                raise DownloadError("Download exceeded {} seconds".format(total_timeout))
+        view.release()
+
+        if length is not None and position != length:
+            raise DownloadError("Download truncated at {} of {} bytes".format(position, length))
+        del buffer[position:]
+        logger.info('Downloaded %s bytes', position)
+        return Download(buffer, digest.hexdigest(), response.headers.get('Content-Type', None))
+
+    except urllib3.exceptions.HTTPError as e:
+        raise DownloadError("Download failed: {}".format(str(e)))
+    finally:
+        response.release_conn()
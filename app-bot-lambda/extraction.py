@@ -0,0 +1,298 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import re
+from trp import Document, FieldExtractor, normalizeKey, parseCurrency
+
+
+# Typed parsers. Each takes the text Textract read and returns the typed
+# value, or None when the text is not a value of that type.
+
+def parse_currency(text):
+    return parseCurrency(text)
+
+
+_ein_pattern = re.compile(r'(?<!\d)(\d{2})\s*-?\s*(\d{7})(?!\d)')
+
+
+def parse_ein(text):
+    match = _ein_pattern.search(text or '')
+    if not match:
+        return None
+    return "{}-{}".format(match.group(1), match.group(2))
+
+
+_year_pattern = re.compile(r'(?<!\d)(19\d{2}|20\d{2})(?!\d)')
+
+
+def parse_year(text):
+    match = _year_pattern.search(text or '')
+    return int(match.group(1)) if match else None
+
+
+# A field to extract. Aliases are the labels it appears under, in order of
+# preference; the first candidate whose value parses wins. Only required
+# fields are worth the full layout search when the form does not have them.
+class FieldSpec:
+
+    def __init__(self, name, aliases, parser, required=False):
+        self.name = name
+        self.aliases = list(aliases)
+        self.parser = parser
+        self.required = required
+
+
+class ExtractionProfile:
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = list(fields)
+        self.aliases = list(dict.fromkeys(alias for field in self.fields for alias in field.aliases))
+
+
+class ExtractedValue:
+
+    def __init__(self, name, value, text, confidence, page, key, source):
+        self.name = name
+        self.value = value
+        self.text = text
+        self.confidence = confidence
+        self.page = page
+        self.key = key
+        # "form" for a Textract key/value pair, "line" for a value on its label's
+        # line or the line right below it, "layout" for a value found next to
+        # its label
+        self.source = source
+
+    def as_dict(self):
+        return {
+            "value": self.value,
+            "text": self.text,
+            "confidence": self.confidence,
+            "page": self.page,
+            "key": self.key,
+            "source": self.source
+        }
+
+
+class ExtractionResult:
+
+    def __init__(self, profile, values):
+        self.profile = profile
+        self.values = values
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def __contains__(self, name):
+        return name in self.values
+
+    def get(self, name, default=None):
+        extracted = self.values.get(name, None)
+        return default if extracted is None else extracted.value
+
+    def confidence(self, name):
+        extracted = self.values.get(name, None)
+        return None if extracted is None else extracted.confidence
+
+    @property
+    def missing(self):
+        return [field.name for field in self.profile.fields if field.name not in self.values]
+
+    def as_dict(self):
+        return dict((name, extracted.as_dict()) for name, extracted in self.values.items())
+
+
+W2_PROFILE = ExtractionProfile("w2", [
+    FieldSpec("wages", [
+        "Social security wages",
+        "Wages, tips, other compensation",
+        "Medicare wages and tips"
+    ], parse_currency, required=True),
+    FieldSpec("federal_tax_withheld", [
+        "Federal income tax withheld"
+    ], parse_currency),
+    FieldSpec("employer_ein", [
+        "Employer identification number",
+        "Employer's FED ID number",
+        "EIN"
+    ], parse_ein),
+    FieldSpec("tax_year", [
+        "Tax year",
+        "Wage and Tax Statement"
+    ], parse_year)
+])
+
+# Fills every field of the profile from a Textract response (or list of
+# result pages). All aliases are matched in one pass over the form's key/value
+# pairs. Optional fields still missing after that are looked for in one pass
+# over the raw LINE blocks; only a missing required field pays for the layout
+# search over a lazily built Document.
+def extract(response, profile=W2_PROFILE):
+    extractor = StreamingExtractor(profile)
+    extractor.add(response)
+    return extractor.result()
+
+
+# Takes the document a few pages at a time, so the key/value pairs of the
+# pages of an asynchronous analysis are matched as each page arrives. Only the
+# line and layout fallbacks wait for the whole document.
+class StreamingExtractor:
+
+    def __init__(self, profile=W2_PROFILE):
+        self.profile = profile
+        self.pages = []
+        self._collector = FieldExtractor(profile.aliases).collector()
+
+    # response is one document page, or a response or list of result pages
+    # holding whole document pages
+    def add(self, response):
+        self._collector.add(response)
+        self.pages.extend(response if isinstance(response, list) else [response])
+
+    def result(self):
+        candidates = self._collector.results()
+        values = {}
+        for field in self.profile.fields:
+            for alias in field.aliases:
+                extracted = first_parsed(field, candidates[alias])
+                if extracted:
+                    values[field.name] = extracted
+                    break
+
+        missing = [field for field in self.profile.fields if field.name not in values]
+        if missing:
+            values.update(extract_from_lines(self.pages, missing, self.profile.aliases))
+        missing = [field for field in missing if field.required and field.name not in values]
+        if missing:
+            values.update(extract_by_layout(self.pages, missing))
+        return ExtractionResult(self.profile, values)
+
+
+def first_parsed(field, candidates):
+    for candidate in candidates:
+        value = field.parser(candidate.value)
+        if value is not None:
+            return ExtractedValue(field.name, value, candidate.value, candidate.confidence,
+                candidate.page, candidate.key, "form")
+    return None
+
+
+def label_pattern(alias):
+    words = [word for word in re.split(r'[\W_]+', alias) if word]
+    return re.compile(r'\b' + r'[\W_]*'.join(re.escape(word) for word in words) + r'\b', re.IGNORECASE)
+
+
+def bounding_box(block):
+    return block.get('Geometry', {}).get('BoundingBox', None)
+
+
+# The nearest line under the label that overlaps it horizontally, or None.
+# Lines without geometry are never below anything.
+def line_below(label, lines):
+    box = bounding_box(label)
+    if not box:
+        return None
+    below = None
+    for line in lines:
+        other = bounding_box(line)
+        if line is label or not other or other['Top'] < box['Top'] + box['Height'] / 2:
+            continue
+        overlap = min(box['Left'] + box['Width'], other['Left'] + other['Width']) - max(box['Left'], other['Left'])
+        if overlap > 0 and (below is None or other['Top'] < bounding_box(below)['Top']):
+            below = line
+    return below
+
+
+# The LINE blocks of each page, in order
+def page_lines(pages):
+    lines = []
+    for page in pages:
+        for block in page['Blocks']:
+            if block['BlockType'] == 'PAGE':
+                if lines:
+                    yield lines
+                lines = []
+            elif block['BlockType'] == 'LINE':
+                lines.append(block)
+    if lines:
+        yield lines
+
+
+# Values on a label's line after the label, or on the line directly below the
+# label (overlapping it horizontally), from the raw LINE blocks. A line that
+# holds any of labels is another field's label, never a value.
+def extract_from_lines(response, fields, labels=None):
+    pages = response if isinstance(response, list) else [response]
+    search = [(field, [label_pattern(alias) for alias in field.aliases]) for field in fields]
+    if labels is None:
+        labels = [alias for field in fields for alias in field.aliases]
+    label_patterns = [label_pattern(alias) for alias in labels]
+
+    def is_label(text):
+        return any(pattern.search(text) for pattern in label_patterns)
+
+    values = {}
+    for page_number, lines in enumerate(page_lines(pages), 1):
+        for block in lines:
+            text = block.get('Text', '')
+            for field, patterns in search:
+                if field.name in values:
+                    continue
+                for pattern in patterns:
+                    match = pattern.search(text)
+                    if not match:
+                        continue
+                    rest = text[match.end():].strip()
+                    if rest and not is_label(rest):
+                        value = field.parser(rest)
+                        if value is not None:
+                            values[field.name] = ExtractedValue(field.name, value, rest, block['Confidence'],
+                                page_number, text, "line")
+                            break
+                    below = line_below(block, lines)
+                    below_text = below.get('Text', '') if below else ''
+                    value = field.parser(below_text) if below_text and not is_label(below_text) else None
+                    if value is not None:
+                        values[field.name] = ExtractedValue(field.name, value, below_text,
+                            min(block['Confidence'], below['Confidence']), page_number, text, "line")
+                    break
+            if len(values) == len(search):
+                return values
+    return values
+
+
+# Values Textract did not link to their label: the nearest line right of or
+# below a line containing the label whose text parses
+def extract_by_layout(response, fields):
+    search = [(field, [normalizeKey(alias) for alias in field.aliases]) for field in fields]
+    values = {}
+    doc = Document(response, lazy=True)
+    for page_number, page in enumerate(doc.pages, 1):
+        for line in page.lines:
+            if len(values) == len(search):
+                return values
+            line_key = normalizeKey(line.text)
+            for field, search_keys in search:
+                if field.name in values or not any(key in line_key for key in search_keys):
+                    continue
+                for candidate in (page.nearestRightOf(line, lines=True), page.nearestBelow(line, lines=True)):
+                    value = field.parser(candidate.text) if candidate else None
+                    if value is not None:
+                        values[field.name] = ExtractedValue(field.name, value, candidate.text,
+                            min(line.confidence, candidate.confidence), page_number, line.text, "layout")
+                        break
+    return values
@@ -0,0 +1,125 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import io
+import logging
+import os
+import threading
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger()
+
+# Normalization settings. Adjust as necessary.
+# Wage documents are at most letter/A4 sized, so the long side of the page is
+# under 11.7 inches; TARGET_DPI then sets the largest useful image size.
+TARGET_DPI = int(os.environ.get('IMAGE_TARGET_DPI', 200))
+PAGE_LONG_SIDE_INCHES = 11.7
+MAX_IMAGE_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 2 * 1024 * 1024))
+MIN_SHORT_SIDE_PIXELS = int(os.environ.get('IMAGE_MIN_SHORT_SIDE', 500))
+JPEG_QUALITIES = (85, 75, 65, 50)
+# Images decoded at once. Each decoded page is held in memory until it has
+# been re-encoded, so this bounds the memory used by concurrent documents.
+MAX_CONCURRENT = int(os.environ.get('IMAGE_MAX_CONCURRENT', 2))
+
+_decoding = threading.BoundedSemaphore(MAX_CONCURRENT)
+
+# EXIF orientation to the transpose that turns the page upright
+ORIENTATION_TRANSPOSE = {
+    2: "FLIP_LEFT_RIGHT",
+    3: "ROTATE_180",
+    4: "FLIP_TOP_BOTTOM",
+    5: "TRANSPOSE",
+    6: "ROTATE_270",
+    7: "TRANSVERSE",
+    8: "ROTATE_90"
+}
+
+
+class ImageRejected(Exception):
+    pass
+
+
+# The image is readable but no JPEG encoding of it fits within max_bytes
+class ImageTooLarge(ImageRejected):
+    pass
+
+
+# Downsamples, straightens and re-encodes an uploaded photo before it is sent
+# to Textract. PDFs, and everything when Pillow is not packaged, pass through.
+def normalize_image(imagebytes, target_dpi=TARGET_DPI, max_bytes=MAX_IMAGE_BYTES, min_short_side=MIN_SHORT_SIDE_PIXELS):
+    if Image is None or bytes(imagebytes[:4]) == b'%PDF':
+        return imagebytes
+
+    try:
+        image = Image.open(io.BytesIO(imagebytes))
+        orientation = image.getexif().get(0x0112, 1)
+    except Exception as e:
+        # Let Textract decide on formats Pillow cannot read
+        logger.info('Image normalization skipped: %s', str(e))
+        return imagebytes
+
+    # The size comes from the header, so small images are rejected before
+    # any pixels are decoded
+    width, height = image.size
+    if min(width, height) < min_short_side:
+        raise ImageRejected("Image resolution {}x{} is below the minimum".format(width, height))
+
+    with _decoding:
+        return _normalize(image, imagebytes, orientation, target_dpi, max_bytes, min_short_side)
+
+
+def _normalize(image, imagebytes, orientation, target_dpi, max_bytes, min_short_side):
+    width, height = image.size
+    max_long_side = int(target_dpi * PAGE_LONG_SIDE_INCHES)
+    resized = max(width, height) > max_long_side
+    scale = min(max_long_side / max(width, height), 1.0)
+    if image.format == 'JPEG':
+        # Let the JPEG decoder scale down by up to 8x and skip the colour
+        # channels, instead of decoding the full photo as RGB
+        image.draft('L', (int(width * scale), int(height * scale)))
+    try:
+        image = image.convert('L')
+    except Exception as e:
+        logger.info('Image normalization skipped: %s', str(e))
+        return imagebytes
+    if resized:
+        image = image.resize((int(width * scale), int(height * scale)), Image.LANCZOS)
+    rotated = orientation in ORIENTATION_TRANSPOSE
+    if rotated:
+        transpose = getattr(Image, 'Transpose', Image)
+        image = image.transpose(getattr(transpose, ORIENTATION_TRANSPOSE[orientation]))
+
+    # Lower the JPEG quality, then the resolution, until the payload fits
+    while True:
+        for quality in JPEG_QUALITIES:
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=quality, optimize=True)
+            if output.tell() <= max_bytes:
+                # Clean scans can already be smaller than the re-encoded image
+                if not rotated and not resized and len(imagebytes) <= output.tell():
+                    return imagebytes
+                logger.info('Image normalized: %s bytes -> %s bytes, %sx%s, quality %s',
+                    len(imagebytes), output.tell(), image.size[0], image.size[1], quality)
+                return output.getvalue()
+        width, height = image.size
+        if min(width, height) * 0.75 < min_short_side:
+            raise ImageTooLarge("Image cannot be reduced below {} bytes".format(max_bytes))
+        image = image.resize((int(width * 0.75), int(height * 0.75)), Image.LANCZOS)
+        resized = True
@@ -16,12 +16,133 @@
 #
 import json
 import logging
+import os
+import time
 import lambda_helpers as helper
+import async_pipeline
+import aws_clients
+import document_urls
+import downloader
+import textract_async
+import textract_cache
+import time_budget
 import utils
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# How long fulfillment waits for a prefetch that is still running, and how old
+# a prefetch request may be before it is assumed lost. In seconds.
+PREFETCH_WAIT_SECONDS = float(os.environ.get('PREFETCH_WAIT_SECONDS', 3))
+PREFETCH_MAX_AGE_SECONDS = float(os.environ.get('PREFETCH_MAX_AGE_SECONDS', 120))
+# How long a continuation waits for the analysis a deferred fulfillment left
+# running, before calling Textract itself. In seconds.
+CONTINUATION_WAIT_SECONDS = float(os.environ.get('CONTINUATION_WAIT_SECONDS', 10))
+# Where decisions finished by a continuation are stored for the agent
+DECISION_BUCKET = os.environ.get('DOCUMENT_BUCKET', None)
+DECISION_PREFIX = 'decisions/'
+
+
+# Prefetch handler: invoked asynchronously by the Lex session adapter as soon
+# as the wage document URL is stored, so Textract runs while the customer is
+# still answering the remaining questions
+def prefetch_handler(prefetch):
+    urlfile = prefetch.get('urlfile', None)
+    if not urlfile:
+        logger.info('Prefetch: no urlfile provided')
+        return
+    logger.info('Prefetch: %s', urlfile)
+    try:
+        urlfile_download = helper.get_urlfile(urlfile)
+        utils.prefetch_document(urlfile_download.data, urlfile_download.digest, urlfile)
+    except Exception as e:
+        # Fulfillment falls back to calling Textract itself, without waiting
+        logger.error('Prefetch error: %s', str(e))
+        try:
+            textract_cache.mark_analysis_failed(urlfile, "{}: {}".format(type(e).__name__, str(e)))
+        except Exception as e:
+            logger.error('Prefetch failure marker error: %s', str(e))
+
+
+# Continuation handler: finishes an evaluation that fulfillment handed off
+# because it could not complete within the Lex time budget. When fulfillment
+# had already started Textract, its analysis may still be running, so the
+# continuation waits for that result in the cache instead of starting another.
+async def continuation_handler(continuation):
+    logger.info('Continuation: %s', json.dumps(continuation))
+    try:
+        urlfiles = continuation.get('urlfiles', None) or [continuation['urlfile']]
+        wait = CONTINUATION_WAIT_SECONDS if continuation.get('analysisStarted', False) else 0
+        documents = await async_pipeline.read_urlfiles(urlfiles, prefetch_wait=wait)
+        if all_failed(documents):
+            raise downloader.DownloadError("No document could be retrieved")
+        loan_response = utils.decide_income(documents, continuation['loanAmount'], continuation.get('loanType', None))
+    except Exception as e:
+        logger.error('Continuation error: %s', str(e))
+        loan_response = utils.referral("We couldn't evaluate your document automatically. An agent will review it.")
+    logger.info('Continuation Loan Response: %s', json.dumps(loan_response))
+
+    if DECISION_BUCKET and continuation.get('sessionId'):
+        record = dict(continuation)
+        record['loanResponse'] = loan_response
+        aws_clients.get_client('s3').put_object(
+            Bucket=DECISION_BUCKET,
+            Key=decision_key(continuation['sessionId']),
+            Body=json.dumps(record).encode('utf-8'),
+            ContentType='application/json',
+            ServerSideEncryption='AES256'
+        )
+    return loan_response
+
+
+# Hands the rest of the evaluation to an asynchronous invocation of this
+# function and transfers the customer to an agent. Nothing contacts the
+# customer afterwards, so no follow-up is promised. The decision is stored
+# under decisionKey, which the contact flow can pass on to the agent from
+# the Lex session attributes.
+def defer_fulfillment(intent, active_contexts, session_attributes, request_attributes, continuation):
+    content = "Your application is taking a little longer than usual to review. I'll transfer you to an agent who can finish reviewing it with you."
+    try:
+        aws_clients.get_client('lambda').invoke(
+            FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+            InvocationType='Event',
+            Payload=json.dumps({"continuation": continuation}).encode('utf-8')
+        )
+    except Exception as e:
+        logger.error('Continuation invoke error: %s', str(e))
+        content = "I wasn't able to finish reviewing your application. I'll transfer you to an agent for further assistance."
+    else:
+        if DECISION_BUCKET and continuation.get('sessionId'):
+            session_attributes['decisionKey'] = decision_key(continuation['sessionId'])
+    intent['state'] = 'Fulfilled'
+    message = {
+        "contentType": "PlainText",
+        "content": content
+    }
+    return helper.close(intent, active_contexts, session_attributes, message, request_attributes)
+
+
+def decision_key(session_id):
+    return DECISION_PREFIX + session_id + '.json'
+
+
+# True when none of the documents that were read could be downloaded
+def all_failed(documents):
+    return all(isinstance(document, (downloader.DownloadError, utils.Skipped)) for document in documents)
+
+
+def prefetch_wait_seconds(session_attributes):
+    requested = session_attributes.get('prefetchRequested', None)
+    if not requested:
+        return 0
+    try:
+        age = time.time() - float(requested)
+    except ValueError:
+        return 0
+    if age > PREFETCH_MAX_AGE_SECONDS:
+        return 0
+    return PREFETCH_WAIT_SECONDS
+
 
 # Validation handler
 def validate_handler(intent, active_contexts, session_attributes, messages, request_attributes):
@@ -68,7 +189,7 @@ def validate_handler(intent, active_contexts, session_attributes, messages, requ
 
 
 # Fulfillment handler
-def fulfill_handler(intent, active_contexts, session_attributes, messages, request_attributes):
+async def fulfill_handler(intent, active_contexts, session_attributes, messages, request_attributes, budget=None, session_id=None):
     intent_name = intent.get('name', None)
     slots = intent.get('slots', None)
     logger.info('Fulfillment: %s, %s', intent_name, json.dumps(intent))
@@ -138,9 +259,9 @@ def fulfill_handler(intent, active_contexts, session_attributes, messages, reque
             # loan approval evaluation
             loan_amount = int(slots['loanAmount']['value']['interpretedValue'])
             loan_type = str(slots['loanType']['value']['interpretedValue'])
-            urlfile = session_attributes.get('urlfile', None)
+            urlfiles = document_urls.get_urlfiles(session_attributes)
 
-            if not urlfile:
+            if not urlfiles:
                 intent['state'] = 'Failed'
                 mycontenttype = "PlainText"
                 mycontent = "Sorry, but we are having technical difficulties. Please try again later."
@@ -150,13 +271,38 @@ def fulfill_handler(intent, active_contexts, session_attributes, messages, reque
                 }
                 return helper.close(intent, active_contexts, session_attributes, message, request_attributes)
 
-            # Retrieve image file
-            urlbytes = helper.get_urlfile_bytes(urlfile)
+            if budget is None:
+                budget = time_budget.TimeBudget()
+            continuation = {
+                "sessionId": session_id,
+                "urlfiles": urlfiles,
+                "loanAmount": loan_amount,
+                "loanType": loan_type
+            }
+
+            logger.info('Loan Evaluate: Type: %s, Amount: %s, Documents: %s', loan_type, loan_amount, len(urlfiles))
+
+            # Retrieve and read the wage docs, within what is left of the budget
+            if not budget.can_start('download'):
+                logger.warning('Fulfillment deferred before download: %.1fs left', budget.remaining())
+                return defer_fulfillment(intent, active_contexts, session_attributes, request_attributes, continuation)
+            try:
+                documents = await async_pipeline.read_urlfiles(urlfiles, budget, prefetch_wait_seconds(session_attributes))
+            except (time_budget.BudgetExceeded, textract_async.AnalysisTimeout) as e:
+                logger.warning('Fulfillment deferred during analysis: %s', str(e))
+                continuation['analysisStarted'] = True
+                return defer_fulfillment(intent, active_contexts, session_attributes, request_attributes, continuation)
 
-            logger.info('Loan Evaluate: Type: %s, Amount: %s', loan_type, loan_amount)
+            if all_failed(documents):
+                intent['state'] = 'Failed'
+                message = {
+                    "contentType": "PlainText",
+                    "content": "Sorry, but I couldn't retrieve your document. Please try again later."
+                }
+                return helper.close(intent, active_contexts, session_attributes, message, request_attributes)
 
-            # Evaluate wage doc and check approval
-            loan_response = utils.evaluate_loan(urlbytes, loan_amount)
+            # Check approval on the combined income
+            loan_response = utils.decide_income(documents, loan_amount, loan_type)
             logger.info('Loan Response: %s', json.dumps(loan_response))
 
             # Respond to the client with results
@@ -175,6 +321,14 @@ def fulfill_handler(intent, active_contexts, session_attributes, messages, reque
 def lambda_handler(event, context):
     logger.info('Lex Event: %s', json.dumps(event))
 
+    # Prefetch request from the Lex session adapter
+    if 'prefetch' in event:
+        return prefetch_handler(event['prefetch'])
+
+    # Evaluation handed off by an earlier fulfillment
+    if 'continuation' in event:
+        return async_pipeline.run(continuation_handler(event['continuation']))
+
     # SessionState
     session_attributes = event['sessionState'].get("sessionAttributes", {})
     intent = event['sessionState'].get("intent", {})
@@ -191,7 +345,10 @@ def lambda_handler(event, context):
         return validate_handler(intent, active_contexts, session_attributes, messages, request_attributes)
 
     elif event['invocationSource'] == 'FulfillmentCodeHook':
-        return fulfill_handler(intent, active_contexts, session_attributes, messages, request_attributes)
+        budget = time_budget.TimeBudget(context)
+        # Fulfillment runs on the container's event loop
+        return async_pipeline.run(fulfill_handler(intent, active_contexts, session_attributes, messages, request_attributes,
+            budget, event.get('sessionId', None)))
 
     else:
         logger.info('Event Error: %s', json.dumps(event))
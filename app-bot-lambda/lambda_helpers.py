@@ -14,7 +14,7 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
-import urllib
+import downloader
 
 
 # --- Helpers that build all of the responses ---
@@ -113,7 +113,9 @@ def listpicker_template(elements, title):
     return template
 
 
+def get_urlfile(urlfile, total_timeout=downloader.TOTAL_TIMEOUT):
+    return downloader.download(urlfile, total_timeout=total_timeout)
+
+
 def get_urlfile_bytes(urlfile):
-    with urllib.request.urlopen(urlfile) as imagefile:
-        imagebytes = bytes(imagefile.read())
-    return imagebytes
+    return get_urlfile(urlfile).data
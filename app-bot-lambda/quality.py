@@ -0,0 +1,111 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import os
+from array import array
+
+# Acceptance thresholds. Adjust as necessary.
+MIN_MEAN_WORD_CONFIDENCE = float(os.environ.get('MIN_MEAN_WORD_CONFIDENCE', 80))
+LOW_KV_CONFIDENCE = float(os.environ.get('LOW_KV_CONFIDENCE', 50))
+MAX_LOW_KV_FRACTION = float(os.environ.get('MAX_LOW_KV_FRACTION', 0.5))
+MIN_TEXT_COVERAGE = float(os.environ.get('MIN_TEXT_COVERAGE', 0.005))
+
+
+# One pass over the raw Textract blocks, before any trp objects are built.
+# Word confidences and areas go into flat double arrays per page. first_page
+# numbers the pages when a document is read a page at a time.
+def page_statistics(response, low_kv_confidence=LOW_KV_CONFIDENCE, first_page=1):
+    if not isinstance(response, list):
+        response = [response]
+
+    pages = []
+    confidences = areas = None
+    kv_total = kv_low = 0
+
+    def finish():
+        if confidences is None:
+            return
+        count = len(confidences)
+        pages.append({
+            "page": first_page + len(pages),
+            "words": count,
+            "mean_word_confidence": sum(confidences) / count if count else 0.0,
+            "min_word_confidence": min(confidences) if count else 0.0,
+            "key_values": kv_total,
+            "low_confidence_kv_fraction": kv_low / kv_total if kv_total else 0.0,
+            "text_coverage": min(sum(areas), 1.0)
+        })
+
+    for chunk in response:
+        for block in chunk['Blocks']:
+            block_type = block['BlockType']
+            if block_type == 'PAGE':
+                finish()
+                confidences = array('d')
+                areas = array('d')
+                kv_total = kv_low = 0
+            elif confidences is None:
+                continue
+            elif block_type == 'WORD':
+                confidences.append(block['Confidence'])
+                bbox = block['Geometry']['BoundingBox']
+                areas.append(bbox['Width'] * bbox['Height'])
+            elif block_type == 'KEY_VALUE_SET':
+                kv_total += 1
+                if block['Confidence'] < low_kv_confidence:
+                    kv_low += 1
+    finish()
+    return pages
+
+
+# Returns (accepted, reasons, pages). Pages without enough text to hold any
+# form data, such as the blank back of a scan, are marked blank and skipped.
+# The checks then apply to the pages with key/value pairs (or every remaining
+# page when Textract found none), and the document is rejected only when none
+# of those pages is clear enough to be worth parsing and scoring.
+def assess_document(response,
+                    min_mean_word_confidence=MIN_MEAN_WORD_CONFIDENCE,
+                    max_low_kv_fraction=MAX_LOW_KV_FRACTION,
+                    min_text_coverage=MIN_TEXT_COVERAGE):
+    return assess_pages(page_statistics(response), min_mean_word_confidence, max_low_kv_fraction, min_text_coverage)
+
+
+# Same assessment over statistics already gathered with page_statistics
+def assess_pages(pages,
+                 min_mean_word_confidence=MIN_MEAN_WORD_CONFIDENCE,
+                 max_low_kv_fraction=MAX_LOW_KV_FRACTION,
+                 min_text_coverage=MIN_TEXT_COVERAGE):
+    for page in pages:
+        page["blank"] = not page["words"] or page["text_coverage"] < min_text_coverage
+    content = [page for page in pages if not page["blank"]]
+    if not pages:
+        return False, ["no pages detected"], pages
+    if not content:
+        return False, ["no text detected on {} page(s)".format(len(pages))], pages
+
+    reasons = []
+    readable = 0
+    for page in [page for page in content if page["key_values"]] or content:
+        page_reasons = []
+        if page["mean_word_confidence"] < min_mean_word_confidence:
+            page_reasons.append("page {}: mean word confidence {:.1f}".format(page["page"], page["mean_word_confidence"]))
+        if page["low_confidence_kv_fraction"] > max_low_kv_fraction:
+            page_reasons.append("page {}: {:.0%} low confidence key/value pairs".format(page["page"], page["low_confidence_kv_fraction"]))
+        if not page_reasons:
+            readable += 1
+        reasons.extend(page_reasons)
+
+    return readable > 0, reasons, pages
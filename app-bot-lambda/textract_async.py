@@ -0,0 +1,138 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import logging
+import os
+import random
+import time
+import aws_clients
+
+logger = logging.getLogger()
+
+# Asynchronous analysis settings. Adjust as necessary. Times are in seconds.
+DOCUMENT_BUCKET = os.environ.get('DOCUMENT_BUCKET', None)
+STAGING_PREFIX = os.environ.get('DOCUMENT_STAGING_PREFIX', 'staging/')
+ANALYSIS_TIMEOUT = float(os.environ.get('ASYNC_ANALYSIS_TIMEOUT', 20))
+POLL_INITIAL_DELAY = 1.0
+POLL_MAX_DELAY = 5.0
+MAX_RESULTS = 1000
+
+
+class AnalysisFailed(Exception):
+    pass
+
+
+class AnalysisTimeout(Exception):
+    pass
+
+
+# Multi-page input (PDF) has to go through StartDocumentAnalysis; single images
+# stay on the synchronous AnalyzeDocument fast path
+def needs_async(imagebytes):
+    return bytes(imagebytes[:4]) == b'%PDF'
+
+
+# Asynchronous analysis only reads from S3, so the document is staged there first
+def stage_document(imagebytes, digest, bucket=None):
+    bucket = bucket or DOCUMENT_BUCKET
+    if not bucket:
+        raise AnalysisFailed("DOCUMENT_BUCKET is not configured")
+    key = STAGING_PREFIX + digest + ".pdf"
+    aws_clients.get_client('s3').put_object(Bucket=bucket, Key=key, Body=imagebytes, ContentType='application/pdf',
+        ServerSideEncryption='AES256')
+    return {'Bucket': bucket, 'Name': key}
+
+
+def start_analysis(textract, s3_object, feature_types, client_token=None):
+    params = {
+        'DocumentLocation': {'S3Object': s3_object},
+        'FeatureTypes': list(feature_types)
+    }
+    if client_token:
+        # Same token, same job: retries do not start a second analysis
+        params['ClientRequestToken'] = client_token[:64]
+    response = textract.start_document_analysis(**params)
+    return response['JobId']
+
+
+# Polls GetDocumentAnalysis with exponential backoff and full jitter until the
+# job finishes, then yields each result page (following NextToken) as it is
+# fetched; see iter_document_pages for parsing them as they arrive.
+# Raises AnalysisTimeout if the job cannot finish before deadline (monotonic).
+def iter_analysis_pages(textract, job_id, deadline, sleep=time.sleep, clock=time.monotonic):
+    attempt = 0
+    while True:
+        response = textract.get_document_analysis(JobId=job_id, MaxResults=MAX_RESULTS)
+        status = response['JobStatus']
+        if status != 'IN_PROGRESS':
+            break
+        delay = random.uniform(0, min(POLL_MAX_DELAY, POLL_INITIAL_DELAY * (2 ** attempt)))
+        if clock() + delay > deadline:
+            raise AnalysisTimeout("Textract job {} still in progress at deadline".format(job_id))
+        sleep(delay)
+        attempt += 1
+
+    if status == 'FAILED':
+        raise AnalysisFailed("Textract job {} failed: {}".format(job_id, response.get('StatusMessage', '')))
+    if status == 'PARTIAL_SUCCESS':
+        logger.warning('Textract job %s partially succeeded: %s', job_id, response.get('Warnings', []))
+
+    while True:
+        response.pop('ResponseMetadata', None)
+        next_token = response.pop('NextToken', None)
+        yield response
+        if not next_token:
+            return
+        if clock() > deadline:
+            raise AnalysisTimeout("Textract job {} results not read before deadline".format(job_id))
+        response = textract.get_document_analysis(JobId=job_id, MaxResults=MAX_RESULTS, NextToken=next_token)
+
+
+# Regroups result pages, which are cut every MAX_RESULTS blocks regardless of
+# the document's pages, into one response per document page. Each page is
+# yielded as soon as the next PAGE block shows it is complete, so it can be
+# parsed while later result pages are still being fetched. The first page
+# carries the DocumentMetadata.
+def iter_document_pages(result_pages):
+    page = None
+    count = 0
+    metadata = None
+    for result in result_pages:
+        metadata = metadata or result.get('DocumentMetadata', None)
+        for block in result['Blocks']:
+            if block['BlockType'] == 'PAGE':
+                if page:
+                    yield page
+                page = {'Blocks': []}
+                if not count and metadata:
+                    page['DocumentMetadata'] = metadata
+                count += 1
+            elif page is None:
+                continue
+            page['Blocks'].append(block)
+    if page:
+        yield page
+
+
+def analyze_document_async(textract, imagebytes, feature_types, digest, timeout=ANALYSIS_TIMEOUT, bucket=None):
+    deadline = time.monotonic() + timeout
+    # Offline clients (textract_stub, the bulk tool) read nothing from S3 and
+    # provide their own stage_document, so no document is uploaded
+    stage = getattr(textract, 'stage_document', None) or stage_document
+    s3_object = stage(imagebytes, digest, bucket)
+    job_id = start_analysis(textract, s3_object, feature_types, client_token=digest)
+    logger.info('Textract job started: %s', job_id)
+    return iter_analysis_pages(textract, job_id, deadline)
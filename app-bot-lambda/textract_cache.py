@@ -0,0 +1,348 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import aws_clients
+import textract_async
+
+logger = logging.getLogger()
+
+# Cache settings. Adjust as necessary.
+MEMORY_CACHE_ENTRIES = int(os.environ.get('TEXTRACT_CACHE_MEMORY_ENTRIES', 32))
+DISK_CACHE_DIR = os.environ.get('TEXTRACT_CACHE_DIR', '/tmp/textract-cache')
+DISK_CACHE_MAX_BYTES = int(os.environ.get('TEXTRACT_CACHE_DISK_MAX_BYTES', 128 * 1024 * 1024))
+DISK_CACHE_TTL_SECONDS = int(os.environ.get('TEXTRACT_CACHE_TTL_SECONDS', 24 * 60 * 60))
+# Shared tier, used to hand prefetched results to whichever container runs fulfillment
+S3_CACHE_BUCKET = os.environ.get('TEXTRACT_CACHE_BUCKET', None)
+S3_CACHE_PREFIX = os.environ.get('TEXTRACT_CACHE_PREFIX', 'textract-cache/')
+
+
+# The cache key covers the document content and the requested feature types,
+# so a re-upload or a retried fulfillment hook maps to the same Textract result.
+def content_digest(imagebytes):
+    return hashlib.sha256(imagebytes).hexdigest()
+
+
+def cache_key(imagebytes=None, feature_types=(), digest=None):
+    if digest is None:
+        digest = content_digest(imagebytes)
+    return "{}-{}".format(digest, "_".join(sorted(feature_types)).lower())
+
+
+# Key of the marker a failed analysis (a prefetch, or one left running by a
+# deferred fulfillment) leaves for a document URL. The URL is used because a
+# prefetch can fail before the content is downloaded.
+def analysis_failure_key(urlfile):
+    return "analysis-failed-" + hashlib.sha256(urlfile.encode('utf-8')).hexdigest()
+
+
+# Backend interface. A backend stores Textract responses (dicts) by key and
+# returns None on a miss. Shared stores only need to implement these three
+# methods; deleting a missing key is not an error.
+class CacheBackend:
+    name = "backend"
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, response):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+# In-process LRU tier; lives at module scope so it survives warm invocations
+class MemoryBackend(CacheBackend):
+    name = "memory"
+
+    def __init__(self, max_entries=MEMORY_CACHE_ENTRIES):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+            return response
+
+    def put(self, key, response):
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# Gzipped JSON files under /tmp, evicted by age and then oldest first once the
+# directory grows past max_bytes. They hold full W-2 results, so they never
+# outlive ttl_seconds or the container, and /tmp is private to this function.
+class DiskBackend(CacheBackend):
+    name = "disk"
+
+    def __init__(self, directory=DISK_CACHE_DIR, max_bytes=DISK_CACHE_MAX_BYTES, ttl_seconds=DISK_CACHE_TTL_SECONDS):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + ".json.gz")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self._ttl_seconds:
+                os.remove(path)
+                return None
+            with gzip.open(path, 'rt') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, response):
+        with self._lock:
+            try:
+                os.makedirs(self._directory, exist_ok=True)
+                temp_path = self._path(key) + ".tmp"
+                with gzip.open(temp_path, 'wt') as cache_file:
+                    json.dump(response, cache_file)
+                os.replace(temp_path, self._path(key))
+                self._evict()
+            except OSError as e:
+                logger.error('Textract disk cache write failed: %s', str(e))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self._directory):
+            path = os.path.join(self._directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self._ttl_seconds:
+                os.remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+# Gzipped JSON objects in S3, shared by every container. Objects are written
+# with SSE-S3 whatever the bucket default; expiry is left to the bucket
+# lifecycle rule (one day in the template).
+class S3Backend(CacheBackend):
+    name = "s3"
+
+    def __init__(self, bucket, prefix=S3_CACHE_PREFIX):
+        self._bucket = bucket
+        self._prefix = prefix
+
+    def get(self, key):
+        s3 = aws_clients.get_client('s3')
+        try:
+            obj = s3.get_object(Bucket=self._bucket, Key=self._prefix + key + ".json.gz")
+        except s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(gzip.decompress(obj['Body'].read()))
+
+    def put(self, key, response):
+        aws_clients.get_client('s3').put_object(
+            Bucket=self._bucket,
+            Key=self._prefix + key + ".json.gz",
+            Body=gzip.compress(json.dumps(response).encode('utf-8')),
+            ContentType='application/json',
+            ContentEncoding='gzip',
+            ServerSideEncryption='AES256'
+        )
+
+    def delete(self, key):
+        aws_clients.get_client('s3').delete_object(Bucket=self._bucket, Key=self._prefix + key + ".json.gz")
+
+
+# Looks up each tier in order and back-fills the faster tiers on a hit
+class TieredCache:
+
+    def __init__(self, backends):
+        self._backends = list(backends)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "puts": 0}
+        for backend in self._backends:
+            self.stats[backend.name + "_hits"] = 0
+
+    def add_backend(self, backend):
+        self._backends.append(backend)
+        self.stats.setdefault(backend.name + "_hits", 0)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, key, count=True):
+        for index, backend in enumerate(self._backends):
+            try:
+                response = backend.get(key)
+            except Exception as e:
+                logger.error('Textract cache %s get failed: %s', backend.name, str(e))
+                continue
+            if response is not None:
+                if count:
+                    self._count("hits")
+                    self._count(backend.name + "_hits")
+                for faster in self._backends[:index]:
+                    faster.put(key, response)
+                return response
+        if count:
+            self._count("misses")
+        return None
+
+    # Polls the tiers until key shows up or timeout seconds pass, for results
+    # another invocation is still producing. Gives up early once abort_key
+    # shows up, the marker of a producer that failed.
+    def wait_for(self, key, timeout, abort_key=None):
+        deadline = time.time() + timeout
+        delay = 0.25
+        while True:
+            response = self.get(key, count=False)
+            if response is not None:
+                self._count("hits")
+                return response
+            remaining = deadline - time.time()
+            if abort_key and self.get(abort_key, count=False) is not None:
+                logger.info('Textract cache wait abandoned, producer failed: %s', key)
+                remaining = 0
+            if remaining <= 0:
+                self._count("misses")
+                return None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 1.0)
+
+    def put(self, key, response):
+        self._count("puts")
+        for backend in self._backends:
+            try:
+                backend.put(key, response)
+            except Exception as e:
+                logger.error('Textract cache %s put failed: %s', backend.name, str(e))
+
+    def delete(self, key):
+        for backend in self._backends:
+            try:
+                backend.delete(key)
+            except Exception as e:
+                logger.error('Textract cache %s delete failed: %s', backend.name, str(e))
+
+
+# Container-wide cache used by the bot
+cache = TieredCache([MemoryBackend(), DiskBackend()])
+if S3_CACHE_BUCKET:
+    cache.add_backend(S3Backend(S3_CACHE_BUCKET))
+
+
+# Records that the analysis of urlfile will not produce a result, so anyone
+# waiting for it stops waiting
+def mark_analysis_failed(urlfile, reason):
+    cache.put(analysis_failure_key(urlfile), {"AnalysisFailed": reason, "Time": time.time()})
+
+
+# Clears the marker once an analysis of urlfile succeeded, so a later wait is
+# not cut short by a failure that has since been retried
+def clear_analysis_failed(urlfile):
+    cache.delete(analysis_failure_key(urlfile))
+
+
+# wait_seconds > 0 means a prefetch or an earlier fulfillment may still be
+# analyzing this document, so give it a chance to land before paying for a
+# second Textract call. With urlfile the wait ends as soon as that analysis is
+# marked failed, and a failure here is marked for whoever waits on this one.
+# on_page receives each document page of an asynchronous analysis as it arrives.
+# prepare transforms the bytes sent on a miss; the key stays on the original bytes.
+# PDFs go through asynchronous analysis and are cached as a list of document pages.
+def analyze_document(textract, imagebytes, feature_types, digest=None, wait_seconds=0, prepare=None,
+                     async_timeout=textract_async.ANALYSIS_TIMEOUT, urlfile=None, on_page=None):
+    if digest is None:
+        digest = content_digest(imagebytes)
+    key = cache_key(feature_types=feature_types, digest=digest)
+    response = cache.get(key)
+    if response is None and wait_seconds > 0:
+        logger.info('Textract cache waiting up to %ss for a running analysis: %s', wait_seconds, key)
+        abort_key = analysis_failure_key(urlfile) if urlfile else None
+        response = cache.wait_for(key, wait_seconds, abort_key)
+    if response is not None:
+        logger.info('Textract cache hit: %s, stats: %s', key, json.dumps(cache.stats))
+        return response
+
+    try:
+        response = _analyze(textract, imagebytes, feature_types, digest, prepare, async_timeout, on_page)
+    except Exception as e:
+        if urlfile:
+            try:
+                mark_analysis_failed(urlfile, "{}: {}".format(type(e).__name__, str(e)))
+            except Exception as marker_error:
+                logger.error('Analysis failure marker error: %s', str(marker_error))
+        raise
+    cache.put(key, response)
+    if urlfile:
+        clear_analysis_failed(urlfile)
+    logger.info('Textract cache miss: %s, stats: %s', key, json.dumps(cache.stats))
+    return response
+
+
+def _analyze(textract, imagebytes, feature_types, digest, prepare, async_timeout, on_page):
+    payload = prepare(imagebytes) if prepare else imagebytes
+    if textract_async.needs_async(payload):
+        # Each document page goes to on_page as soon as it is complete, so it is
+        # parsed while later result pages download; the list of pages is cached
+        response = []
+        for page in textract_async.iter_document_pages(
+                textract_async.analyze_document_async(textract, payload, feature_types, digest, timeout=async_timeout)):
+            response.append(page)
+            if on_page is not None:
+                on_page(page)
+    else:
+        response = textract.analyze_document(
+            Document={
+                'Bytes': payload
+            },
+            FeatureTypes=list(feature_types))
+        # ResponseMetadata is specific to the original call
+        response.pop('ResponseMetadata', None)
+    return response
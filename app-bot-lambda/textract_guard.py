@@ -0,0 +1,328 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger()
+
+# Admission control settings. Adjust as necessary. Rates are calls per second
+# per container, times are in seconds.
+OPERATION_RATES = {
+    "analyze_document": float(os.environ.get('TEXTRACT_ANALYZE_TPS', 2)),
+    "start_document_analysis": float(os.environ.get('TEXTRACT_START_TPS', 2)),
+    "get_document_analysis": float(os.environ.get('TEXTRACT_GET_TPS', 5))
+}
+BURST = 2
+MAX_ADMISSION_WAIT = float(os.environ.get('TEXTRACT_MAX_ADMISSION_WAIT', 2))
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = int(os.environ.get('TEXTRACT_MAX_CONCURRENCY', 10))
+MAX_RETRIES = 2
+RETRY_BASE_DELAY = 0.2
+FAILURE_THRESHOLD = int(os.environ.get('TEXTRACT_FAILURE_THRESHOLD', 5))
+OPEN_SECONDS = float(os.environ.get('TEXTRACT_OPEN_SECONDS', 30))
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'VirtualCreditAgent')
+
+THROTTLE_CODES = {
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "TooManyRequestsException"
+}
+# Errors about the document itself; every other error (server errors, but also
+# AccessDenied or expired credentials) is a Textract failure for the breaker
+DOCUMENT_ERROR_CODES = {
+    "UnsupportedDocumentException",
+    "BadDocumentException",
+    "DocumentTooLargeException",
+    "InvalidParameterException"
+}
+
+
+class TextractUnavailable(Exception):
+    pass
+
+
+class CircuitOpen(TextractUnavailable):
+    pass
+
+
+class AdmissionRejected(TextractUnavailable):
+    pass
+
+
+# Textract refused the document itself (unsupported format, corrupt or too
+# large), so retrying or another Textract call will not help
+class DocumentRejected(Exception):
+    pass
+
+
+def error_code(error):
+    response = getattr(error, 'response', None)
+    if not isinstance(response, dict):
+        return None
+    return response.get('Error', {}).get('Code', None)
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst=BURST, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    # Takes a token, or returns how long to wait for the next one
+    def _take(self):
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, max_wait, sleep=time.sleep):
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if not delay:
+                return True
+            if waited + delay > max_wait:
+                return False
+            sleep(delay)
+            waited += delay
+
+
+# Concurrency limit that grows by one per limit's worth of successful calls and
+# halves on throttling (additive increase, multiplicative decrease)
+class AdaptiveLimit:
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.inflight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, max_wait):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.inflight < int(self.limit), timeout=max_wait):
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.inflight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, open_seconds=OPEN_SECONDS, clock=time.monotonic):
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._failures = 0
+        self._opened = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened is None:
+            return "closed"
+        if self._clock() - self._opened < self.open_seconds:
+            return "open"
+        return "half-open"
+
+    # After the open period a single trial call is let through
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    # Gives the trial back when the trial call ended without a result, for
+    # example when it was not admitted, so the next call can try instead
+    def abandon(self):
+        with self._lock:
+            self._trial = False
+
+    def success(self):
+        with self._lock:
+            if self._opened is not None:
+                logger.info('Textract circuit closed')
+            self._failures = 0
+            self._opened = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                if self._opened is None or self._trial:
+                    logger.warning('Textract circuit opened after %s failures', self._failures)
+                self._opened = self._clock()
+                self._trial = False
+
+
+class Metrics:
+    NAMES = ("Calls", "Succeeded", "Retried", "Throttled", "Rejected", "ShortCircuited", "Failed")
+
+    def __init__(self):
+        self._counts = dict.fromkeys(self.NAMES, 0)
+        self._lock = threading.Lock()
+
+    def increment(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            counts = dict(self._counts)
+            if reset:
+                self._counts = dict.fromkeys(self.NAMES, 0)
+        return counts
+
+
+# Wraps a Textract client. Every call takes a token from its operation's
+# bucket and a slot under the adaptive concurrency limit, throttled calls are
+# retried with jittered backoff, and repeated failures other than document
+# errors (throttling, server, access or credential errors) open the circuit so
+# later calls fail fast with CircuitOpen instead of queueing.
+class GuardedTextract:
+
+    def __init__(self, client, rates=OPERATION_RATES, limit=None, breaker=None, metrics=None,
+            max_wait=MAX_ADMISSION_WAIT, sleep=time.sleep):
+        self.client = client
+        self.buckets = dict((operation, TokenBucket(rate)) for operation, rate in rates.items())
+        self.limit = limit or AdaptiveLimit()
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or Metrics()
+        self.max_wait = max_wait
+        self._sleep = sleep
+
+    def __getattr__(self, name):
+        if name not in self.buckets:
+            return getattr(self.client, name)
+        return lambda **params: self.call(name, **params)
+
+    def call(self, operation, **params):
+        self.metrics.increment("Calls")
+        if not self.breaker.allow():
+            self.metrics.increment("ShortCircuited")
+            raise CircuitOpen("Textract circuit is open")
+
+        # Every exit path must report to the breaker, otherwise a half-open
+        # trial that never reached Textract would keep the circuit open
+        reported = False
+        try:
+            attempt = 0
+            while True:
+                if not self.buckets[operation].acquire(self.max_wait, self._sleep):
+                    self.metrics.increment("Rejected")
+                    raise AdmissionRejected("No {} capacity within {}s".format(operation, self.max_wait))
+                if not self.limit.acquire(self.max_wait):
+                    self.metrics.increment("Rejected")
+                    raise AdmissionRejected("Textract concurrency limit {} reached".format(int(self.limit.limit)))
+
+                try:
+                    response = getattr(self.client, operation)(**params)
+                except Exception as e:
+                    code = error_code(e)
+                    throttled = code in THROTTLE_CODES
+                    self.limit.release(throttled)
+                    if code in DOCUMENT_ERROR_CODES:
+                        # Bad input, not a Textract health problem
+                        self.breaker.success()
+                        reported = True
+                        raise DocumentRejected("{} rejected the document: {}".format(operation, code)) from e
+                    if throttled:
+                        self.metrics.increment("Throttled")
+                    if throttled and attempt < MAX_RETRIES:
+                        attempt += 1
+                        self.metrics.increment("Retried")
+                        self._sleep(random.uniform(0, RETRY_BASE_DELAY * (2 ** attempt)))
+                        continue
+                    self.metrics.increment("Failed")
+                    self.breaker.failure()
+                    reported = True
+                    raise TextractUnavailable("{} failed: {}".format(operation, code or str(e))) from e
+
+                self.limit.release()
+                self.breaker.success()
+                reported = True
+                self.metrics.increment("Succeeded")
+                return response
+        finally:
+            if not reported:
+                self.breaker.abandon()
+
+    # Logs the counters since the last call in CloudWatch embedded metric
+    # format, so they show up as metrics without any extra API calls
+    def emit_metrics(self):
+        counts = self.metrics.snapshot(reset=True)
+        if not counts["Calls"]:
+            return counts
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Service"]],
+                    "Metrics": [{"Name": "Textract" + name, "Unit": "Count"} for name in Metrics.NAMES]
+                }]
+            },
+            "Service": "Textract",
+            "CircuitState": self.breaker.state,
+            "ConcurrencyLimit": self.limit.limit
+        }
+        for name, count in counts.items():
+            record["Textract" + name] = count
+        print(json.dumps(record))
+        return counts
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+# Returns the container-wide guard around client, so limits and circuit state
+# carry over between warm invocations
+def guard(client):
+    global _guard
+    with _guard_lock:
+        if _guard is None or _guard.client is not client:
+            _guard = GuardedTextract(client)
+    return _guard
@@ -0,0 +1,106 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import itertools
+import json
+import random
+import time
+
+
+# Raised for injected failures; carries the same response shape as
+# botocore.exceptions.ClientError
+class StubClientError(Exception):
+
+    def __init__(self, code, operation):
+        super().__init__("An error occurred ({}) when calling the {} operation".format(code, operation))
+        self.response = {'Error': {'Code': code, 'Message': 'Injected by StubTextract'}}
+
+
+# Offline stand-in for the Textract client. It answers the synchronous and
+# asynchronous document analysis calls from a canned response (for example a
+# stored Textract JSON file), so the bot can be exercised without AWS access.
+# Throttling can be injected for the first throttle_calls calls and then at
+# throttle_rate, and latency adds a delay to every call.
+class StubTextract:
+
+    def __init__(self, response, in_progress_polls=2, page_size=1000, job_status='SUCCEEDED',
+            throttle_calls=0, throttle_rate=0.0, latency=0.0, seed=None,
+            throttle_code='ProvisionedThroughputExceededException'):
+        if isinstance(response, str):
+            with open(response, 'rt') as response_file:
+                response = json.load(response_file)
+        if isinstance(response, list):
+            response = {'Blocks': [block for page in response for block in page['Blocks']]}
+        self._response = response
+        self._in_progress_polls = in_progress_polls
+        self._page_size = page_size
+        self._job_status = job_status
+        self._jobs = {}
+        self._job_ids = itertools.count(1)
+        self._throttle_calls = throttle_calls
+        self._throttle_rate = throttle_rate
+        self._throttle_code = throttle_code
+        self._latency = latency
+        self._random = random.Random(seed)
+        self.calls = []
+        self.throttled = 0
+
+    def _call(self, operation):
+        self.calls.append(operation)
+        if self._latency:
+            time.sleep(self._latency)
+        if len(self.calls) <= self._throttle_calls or self._random.random() < self._throttle_rate:
+            self.throttled += 1
+            raise StubClientError(self._throttle_code, operation)
+
+    def analyze_document(self, Document, FeatureTypes, **kwargs):
+        self._call('AnalyzeDocument')
+        return json.loads(json.dumps(self._response))
+
+    # Stands in for textract_async.stage_document: the stub answers from its
+    # canned response, so nothing is uploaded to S3
+    def stage_document(self, imagebytes, digest, bucket=None):
+        return {'Bucket': 'stub', 'Name': digest + ".pdf"}
+
+    def start_document_analysis(self, DocumentLocation, FeatureTypes, ClientRequestToken=None, **kwargs):
+        self._call('StartDocumentAnalysis')
+        for job_id, job in self._jobs.items():
+            if ClientRequestToken and job['token'] == ClientRequestToken:
+                return {'JobId': job_id}
+        job_id = "stub-job-{}".format(next(self._job_ids))
+        self._jobs[job_id] = {'token': ClientRequestToken, 'polls': 0}
+        return {'JobId': job_id}
+
+    def get_document_analysis(self, JobId, MaxResults=1000, NextToken=None, **kwargs):
+        self._call('GetDocumentAnalysis')
+        job = self._jobs[JobId]
+        if job['polls'] < self._in_progress_polls:
+            job['polls'] += 1
+            return {'JobStatus': 'IN_PROGRESS'}
+        if self._job_status == 'FAILED':
+            return {'JobStatus': 'FAILED', 'StatusMessage': 'Stub failure'}
+
+        page_size = min(MaxResults, self._page_size)
+        start = int(NextToken) if NextToken else 0
+        blocks = self._response['Blocks'][start:start + page_size]
+        result = {
+            'JobStatus': self._job_status,
+            'DocumentMetadata': self._response.get('DocumentMetadata', {'Pages': 1}),
+            'Blocks': json.loads(json.dumps(blocks))
+        }
+        if start + page_size < len(self._response['Blocks']):
+            result['NextToken'] = str(start + page_size)
+        return result
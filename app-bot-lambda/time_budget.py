@@ -0,0 +1,87 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import concurrent.futures
+import logging
+import os
+import time
+
+logger = logging.getLogger()
+
+# Lex waits this long for the code hook before failing the turn, independently
+# of the Lambda timeout. In milliseconds.
+LEX_TIMEOUT_MS = int(os.environ.get('LEX_TIMEOUT_MS', 30000))
+# Time kept back to build and return the response. In milliseconds.
+SAFETY_MARGIN_MS = int(os.environ.get('BUDGET_SAFETY_MARGIN_MS', 1500))
+
+# Minimum time each fulfillment stage needs, in seconds. A stage only starts
+# when it and every stage after it still fit in the remaining budget.
+STAGE_BUDGETS = {
+    "download": 2.0,
+    "analyze": 4.0,
+    "parse": 1.0,
+    "decide": 0.2
+}
+STAGES = ["download", "analyze", "parse", "decide"]
+
+# Worker threads for stages that must be abandoned when their budget runs out.
+# Sized for several documents being read at once plus abandoned stragglers.
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class TimeBudget:
+
+    def __init__(self, context=None, lex_timeout_ms=LEX_TIMEOUT_MS, margin_ms=SAFETY_MARGIN_MS, clock=time.monotonic):
+        available_ms = lex_timeout_ms
+        if context is not None:
+            available_ms = min(available_ms, context.get_remaining_time_in_millis())
+        self._clock = clock
+        self._deadline = clock() + (available_ms - margin_ms) / 1000.0
+
+    def remaining(self):
+        return max(self._deadline - self._clock(), 0.0)
+
+    def _reserved_after(self, stage):
+        return sum(STAGE_BUDGETS[later] for later in STAGES[STAGES.index(stage) + 1:])
+
+    def can_start(self, stage):
+        return self.remaining() >= STAGE_BUDGETS[stage] + self._reserved_after(stage)
+
+    # Seconds a stage may take while leaving enough for the stages after it
+    def time_for(self, stage):
+        return max(self.remaining() - self._reserved_after(stage), 0.0)
+
+    def check(self, stage):
+        if not self.can_start(stage):
+            raise BudgetExceeded("{:.1f}s left, not enough to start {}".format(self.remaining(), stage))
+
+
+# Runs fn in a worker thread and gives up after timeout seconds. The worker is
+# left to finish in the background, so side effects such as cache writes still
+# land for a later retry or continuation.
+def run_with_timeout(fn, timeout, stage="stage"):
+    if timeout is None:
+        return fn()
+    future = _executor.submit(fn)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        logger.warning('%s did not finish within %.1fs', stage, timeout)
+        raise BudgetExceeded("{} exceeded {:.1f}s".format(stage, timeout))
@@ -14,9 +14,142 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
+import bisect
+import codecs
 import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+
+_keyNormalizer = re.compile(r'[\W_]+', re.UNICODE)
+_minFuzzyKeyLength = 5
+
+_blocksArrayStart = re.compile(r'"Blocks"\s*:\s*\[')
+_jsonDecoder = json.JSONDecoder()
+
+def iterJsonBlocks(fp, chunkSize=65536):
+    # Incrementally reads stored Textract JSON (a single response or a list of
+    # responses) from a text or binary file object and yields one block dict
+    # at a time, so only the block being decoded and one read chunk are held in
+    # memory. Everything outside the "Blocks" arrays is skipped.
+    decoder = None
+    buffer = ""
+    pos = 0
+    inBlocks = False
+    eof = False
+
+    while True:
+        if(not inBlocks):
+            match = _blocksArrayStart.search(buffer, pos)
+            if(match):
+                pos = match.end()
+                inBlocks = True
+                continue
+            # Keep a short tail in case the "Blocks" key spans two reads
+            buffer = buffer[max(pos, len(buffer) - 64):]
+            pos = 0
+        else:
+            while(pos < len(buffer) and buffer[pos] in ' \t\r\n,'):
+                pos += 1
+            if(pos < len(buffer)):
+                if(buffer[pos] == ']'):
+                    pos += 1
+                    inBlocks = False
+                    continue
+                try:
+                    block, end = _jsonDecoder.raw_decode(buffer, pos)
+                except ValueError:
+                    # Incomplete block, unless there is nothing left to read
+                    if(eof):
+                        raise
+                else:
+                    pos = end
+                    yield block
+                    continue
+            if(pos > chunkSize):
+                buffer = buffer[pos:]
+                pos = 0
+
+        if(eof):
+            if(inBlocks):
+                raise ValueError("Unexpected end of Textract JSON inside Blocks array")
+            return
+        chunk = fp.read(chunkSize)
+        # End of input is an empty read. A read that stops inside a multi-byte
+        # character decodes to nothing yet, so check before decoding.
+        eof = not chunk
+        if(isinstance(chunk, bytes)):
+            if(decoder is None):
+                decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = decoder.decode(chunk, final=eof)
+        buffer = buffer + chunk
+
+def normalizeKey(text):
+    # Case-folded key text without whitespace or punctuation, so OCR variants
+    # like "Social Security Wages:" and "Socialsecurity wages" compare equal
+    return _keyNormalizer.sub('', text).casefold()
+
+def _keyGrams(normalizedKey, n=3):
+    return {normalizedKey[i:i + n] for i in range(len(normalizedKey) - n + 1)}
+
+def _editDistance(a, b, maxDistance):
+    # Levenshtein distance, or None as soon as it is known to exceed maxDistance
+    if(abs(len(a) - len(b)) > maxDistance):
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if(min(current) > maxDistance):
+            return None
+        previous = current
+    if(previous[-1] > maxDistance):
+        return None
+    return previous[-1]
+
+def _matchKey(normalizedQuery, normalizedKey, maxDistance):
+    # Rank tuple for a key that matches the query, or None. Exact matches rank
+    # first, then keys containing the query, then fuzzy matches by edit distance.
+    # Short queries like "EIN" only match exactly; as substrings or within a
+    # couple of edits they would match unrelated keys ("stateincometax").
+    if(normalizedQuery == normalizedKey):
+        return (0, 0)
+    if(len(normalizedQuery) < _minFuzzyKeyLength):
+        return None
+    if(normalizedQuery in normalizedKey):
+        return (0, len(normalizedKey) - len(normalizedQuery))
+    distance = _editDistance(normalizedQuery, normalizedKey, maxDistance)
+    if(distance is None):
+        return None
+    return (distance, abs(len(normalizedKey) - len(normalizedQuery)))
+
+class BlockMap(dict):
+    # Block Id -> raw block, plus an identity map of the objects built from
+    # those blocks so each one is materialized at most once per document
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.objects = {}
+
+def _materialize(cls, block, blockMap):
+    # Shared instance of cls for block when blockMap keeps an identity map,
+    # otherwise a new one (plain dicts passed in by callers)
+    objects = getattr(blockMap, 'objects', None)
+    if(objects is None):
+        return cls(block, blockMap)
+    obj = objects.get(block['Id'])
+    if(obj is None):
+        obj = cls(block, blockMap)
+        objects[block['Id']] = obj
+    return obj
 
 class BoundingBox:
+    __slots__ = ('_width', '_height', '_left', '_top')
+
     def __init__(self, width, height, left, top):
         self._width = width
         self._height = height
@@ -43,6 +176,8 @@ class BoundingBox:
         return self._top
 
 class Polygon:
+    __slots__ = ('_x', '_y')
+
     def __init__(self, x, y):
         self._x = x
         self._y = y
@@ -59,30 +194,35 @@ class Polygon:
         return self._y
 
 class Geometry:
-    def __init__(self, geometry):
-        boundingBox = geometry["BoundingBox"]
-        polygon = geometry["Polygon"]
-        bb = BoundingBox(boundingBox["Width"], boundingBox["Height"], boundingBox["Left"], boundingBox["Top"])
-        pgs = []
-        for pg in polygon:
-            pgs.append(Polygon(pg["X"], pg["Y"]))
+    __slots__ = ('_geometry', '_boundingBox', '_polygon')
 
-        self._boundingBox = bb
-        self._polygon = pgs
+    def __init__(self, geometry):
+        # Keep a reference to the raw Textract geometry and only build the
+        # BoundingBox and Polygon objects the first time they are read.
+        self._geometry = geometry
+        self._boundingBox = None
+        self._polygon = None
 
     def __str__(self):
-        s = "BoundingBox: {}\n".format(str(self._boundingBox))
+        s = "BoundingBox: {}\n".format(str(self.boundingBox))
         return s
 
     @property
     def boundingBox(self):
+        if(self._boundingBox is None):
+            boundingBox = self._geometry["BoundingBox"]
+            self._boundingBox = BoundingBox(boundingBox["Width"], boundingBox["Height"], boundingBox["Left"], boundingBox["Top"])
         return self._boundingBox
 
     @property
     def polygon(self):
+        if(self._polygon is None):
+            self._polygon = [Polygon(pg["X"], pg["Y"]) for pg in self._geometry["Polygon"]]
         return self._polygon
 
 class Word:
+    __slots__ = ('_block', '_confidence', '_geometry', '_id', '_text')
+
     def __init__(self, block, blockMap):
         self._block = block
         self._confidence = block['Confidence']
@@ -133,7 +273,7 @@ class Line:
                 if(rs['Type'] == 'CHILD'):
                     for cid in rs['Ids']:
                         if(blockMap[cid]["BlockType"] == "WORD"):
-                            self._words.append(Word(blockMap[cid], blockMap))
+                            self._words.append(_materialize(Word, blockMap[cid], blockMap))
     def __str__(self):
         s = "Line\n==========\n"
         s = s + self._text + "\n"
@@ -167,6 +307,8 @@ class Line:
         return self._block
 
 class SelectionElement:
+    __slots__ = ('_confidence', '_geometry', '_id', '_selectionStatus')
+
     def __init__(self, block, blockMap):
         self._confidence = block['Confidence']
         self._geometry = Geometry(block['Geometry'])
@@ -203,7 +345,7 @@ class FieldKey:
         for eid in children:
             wb = blockMap[eid]
             if(wb['BlockType'] == "WORD"):
-                w = Word(wb, blockMap)
+                w = _materialize(Word, wb, blockMap)
                 self._content.append(w)
                 t.append(w.text)
 
@@ -251,11 +393,11 @@ class FieldValue:
         for eid in children:
             wb = blockMap[eid]
             if(wb['BlockType'] == "WORD"):
-                w = Word(wb, blockMap)
+                w = _materialize(Word, wb, blockMap)
                 self._content.append(w)
                 t.append(w.text)
             elif(wb['BlockType'] == "SELECTION_ELEMENT"):
-                se = SelectionElement(wb, blockMap)
+                se = _materialize(SelectionElement, wb, blockMap)
                 self._content.append(se)
                 self._text = se.selectionStatus
 
@@ -328,11 +470,22 @@ class Form:
     def __init__(self):
         self._fields = []
         self._fieldsMap = {}
+        # Normalized key -> field positions, and character trigram -> field positions
+        self._normalizedIndex = {}
+        self._gramIndex = {}
+        self._normalizedKeys = []
 
     def addField(self, field):
+        position = len(self._fields)
         self._fields.append(field)
         self._fieldsMap[field.key.text] = field
 
+        normalizedKey = normalizeKey(field.key.text)
+        self._normalizedKeys.append(normalizedKey)
+        self._normalizedIndex.setdefault(normalizedKey, []).append(position)
+        for gram in _keyGrams(normalizedKey):
+            self._gramIndex.setdefault(gram, []).append(position)
+
     def __str__(self):
         s = ""
         for field in self._fields:
@@ -347,6 +500,10 @@ class Form:
         field = None
         if(key in self._fieldsMap):
             field = self._fieldsMap[key]
+        else:
+            positions = self._normalizedIndex.get(normalizeKey(key))
+            if(positions):
+                field = self._fields[positions[0]]
         return field
     
     def searchFieldsByKey(self, key):
@@ -357,6 +514,33 @@ class Form:
                 results.append(field)
         return results
 
+    def findField(self, key, maxDistance=2):
+        # Fields whose normalized key equals, contains, or is within maxDistance
+        # edits of the normalized search key, best match first
+        normalizedQuery = normalizeKey(key)
+        if(not normalizedQuery):
+            return []
+
+        queryGrams = _keyGrams(normalizedQuery)
+        if(queryGrams):
+            # A key within maxDistance edits of the query still shares this many trigrams
+            minShared = max(1, len(queryGrams) - 3 * maxDistance)
+            shared = {}
+            for gram in queryGrams:
+                for position in self._gramIndex.get(gram, ()):
+                    shared[position] = shared.get(position, 0) + 1
+            candidates = [position for position, count in shared.items() if count >= minShared]
+        else:
+            candidates = range(len(self._fields))
+
+        ranked = []
+        for position in candidates:
+            rank = _matchKey(normalizedQuery, self._normalizedKeys[position], maxDistance)
+            if(rank is not None):
+                ranked.append((rank, position))
+        ranked.sort()
+        return [self._fields[position] for rank, position in ranked]
+
 class Cell:
 
     def __init__(self, block, blockMap):
@@ -376,11 +560,11 @@ class Cell:
                     for cid in rs['Ids']:
                         blockType = blockMap[cid]["BlockType"]
                         if(blockType == "WORD"):
-                            w = Word(blockMap[cid], blockMap)
+                            w = _materialize(Word, blockMap[cid], blockMap)
                             self._content.append(w)
                             self._text = self._text + w.text + ' '
                         elif(blockType == "SELECTION_ELEMENT"):
-                            se = SelectionElement(blockMap[cid], blockMap)
+                            se = _materialize(SelectionElement, blockMap[cid], blockMap)
                             self._content.append(se)
                             self._text = self._text + se.selectionStatus + ', '
 
@@ -441,6 +625,25 @@ class Row:
     def cells(self):
         return self._cells
 
+_currencyCleaner = re.compile(r'[\s$,]')
+
+def parseCurrency(text):
+    # Parses amounts like "$1,234.50", "(12.00)" or "-3" into a float, or None
+    if(text is None):
+        return None
+    value = _currencyCleaner.sub('', text)
+    negative = False
+    if(value.startswith('(') and value.endswith(')')):
+        value = value[1:-1]
+        negative = True
+    if(not value):
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return -number if negative else number
+
 class Table:
 
     def __init__(self, block, blockMap):
@@ -452,22 +655,27 @@ class Table:
 
         self._id = block['Id']
         self._rows = []
+        self._cells = []
+        self._grid = None
+        self._headerRowCount = None
 
-        ri = 1
-        row = Row()
-        cell = None
         if('Relationships' in block and block['Relationships']):
             for rs in block['Relationships']:
                 if(rs['Type'] == 'CHILD'):
                     for cid in rs['Ids']:
-                        cell = Cell(blockMap[cid], blockMap)
-                        if(cell.rowIndex > ri):
-                            self._rows.append(row)
-                            row = Row()
-                            ri = cell.rowIndex
-                        row.cells.append(cell)
-                    if(row and row.cells):
-                        self._rows.append(row)
+                        if(blockMap[cid]['BlockType'] == 'CELL'):
+                            self._cells.append(Cell(blockMap[cid], blockMap))
+
+        # Textract does not guarantee cell order, so group rows by index
+        self._cells.sort(key=lambda cell: (cell.rowIndex, cell.columnIndex))
+        row = None
+        ri = None
+        for cell in self._cells:
+            if(cell.rowIndex != ri):
+                row = Row()
+                self._rows.append(row)
+                ri = cell.rowIndex
+            row.cells.append(cell)
 
     def __str__(self):
         s = "Table\n==========\n"
@@ -476,6 +684,130 @@ class Table:
             s = s + str(row) + "\n"
         return s
 
+    def _buildGrid(self):
+        # Dense rowCount x columnCount grid; a spanning cell fills every slot it covers
+        rowCount = 0
+        columnCount = 0
+        for cell in self._cells:
+            rowCount = max(rowCount, cell.rowIndex + cell.rowSpan - 1)
+            columnCount = max(columnCount, cell.columnIndex + cell.columnSpan - 1)
+        grid = [[None] * columnCount for r in range(rowCount)]
+        for cell in self._cells:
+            for r in range(cell.rowIndex - 1, cell.rowIndex - 1 + cell.rowSpan):
+                for c in range(cell.columnIndex - 1, cell.columnIndex - 1 + cell.columnSpan):
+                    grid[r][c] = cell
+        self._grid = grid
+
+    @property
+    def grid(self):
+        if(self._grid is None):
+            self._buildGrid()
+        return self._grid
+
+    @property
+    def rowCount(self):
+        return len(self.grid)
+
+    @property
+    def columnCount(self):
+        grid = self.grid
+        return len(grid[0]) if grid else 0
+
+    def cell(self, rowIndex, columnIndex):
+        # Cell covering the 1-based (rowIndex, columnIndex) slot, following spans
+        grid = self.grid
+        if(1 <= rowIndex <= len(grid) and 1 <= columnIndex <= len(grid[rowIndex - 1])):
+            return grid[rowIndex - 1][columnIndex - 1]
+        return None
+
+    @property
+    def headerRowCount(self):
+        # Leading rows marked COLUMN_HEADER by Textract, or else a first row of
+        # non-numeric text above rows holding numbers
+        if(self._headerRowCount is None):
+            count = 0
+            for row in self.grid:
+                if(row and all(cell is not None and 'COLUMN_HEADER' in cell.block.get('EntityTypes', []) for cell in row)):
+                    count += 1
+                else:
+                    break
+            if(count == 0 and len(self.grid) > 1):
+                first = [cell.text.strip() if cell else '' for cell in self.grid[0]]
+                if(any(first) and all(parseCurrency(text) is None for text in first)):
+                    for row in self.grid[1:]:
+                        if(any(cell is not None and parseCurrency(cell.text) is not None for cell in row)):
+                            count = 1
+                            break
+            self._headerRowCount = count
+        return self._headerRowCount
+
+    @property
+    def headers(self):
+        # Column names, joining multi-row headers. Columns without a header, or
+        # repeating one through a column span, are named by position.
+        names = []
+        for c in range(self.columnCount):
+            parts = []
+            for r in range(self.headerRowCount):
+                cell = self.grid[r][c]
+                text = cell.text.strip() if cell else ''
+                if(text and (not parts or parts[-1] != text)):
+                    parts.append(text)
+            name = ' '.join(parts) if parts else str(c + 1)
+            if(name in names):
+                name = "{} {}".format(name, c + 1)
+            names.append(name)
+        return names
+
+    def getColumnIndex(self, name):
+        # 1-based index of the column whose header matches name, or None
+        headers = self.headers
+        if(name in headers):
+            return headers.index(name) + 1
+        searchKey = normalizeKey(name)
+        for c, header in enumerate(headers):
+            if(normalizeKey(header) == searchKey):
+                return c + 1
+        return None
+
+    def _bodySlots(self, columnIndex):
+        # (cell, isOrigin) for each body slot of a 1-based column. A spanning
+        # cell is only the origin of its top-left slot.
+        slots = []
+        for r in range(self.headerRowCount, self.rowCount):
+            cell = self.grid[r][columnIndex - 1]
+            slots.append((cell, cell is None or (cell.rowIndex == r + 1 and cell.columnIndex == columnIndex)))
+        return slots
+
+    def column(self, name):
+        # Body cells of a column, by header name or 1-based index. Slots covered
+        # by a cell spanning from another row or column are None, so a
+        # "Balance forward" note across the table is not repeated in every column.
+        columnIndex = name if isinstance(name, int) else self.getColumnIndex(name)
+        if(columnIndex is None or not 1 <= columnIndex <= self.columnCount):
+            return []
+        return [cell if isOrigin else None for cell, isOrigin in self._bodySlots(columnIndex)]
+
+    def toColumns(self, parseNumbers=True):
+        # Body as {header: [values]}, a layout that pyarrow.table() and
+        # pandas.DataFrame() accept directly. Empty slots are '' and slots
+        # covered by a span are None. With parseNumbers, a column whose
+        # non-empty cells are all amounts is converted to floats in one pass.
+        columns = {}
+        for c, header in enumerate(self.headers):
+            values = []
+            for cell, isOrigin in self._bodySlots(c + 1):
+                if(not isOrigin):
+                    values.append(None)
+                else:
+                    values.append(cell.text.strip() if cell else '')
+            if(parseNumbers):
+                numbers = [parseCurrency(value) for value in values]
+                if(any(values) and all(number is not None or not value for number, value in zip(numbers, values))):
+                    values = numbers
+            columns[header] = values
+        return columns
+
     @property
     def confidence(self):
         return self._confidence
@@ -492,81 +824,242 @@ class Table:
     def rows(self):
         return self._rows
 
+    @property
+    def cells(self):
+        return self._cells
+
     @property
     def block(self):
         return self._block
 
+def _boxOf(item):
+    # (left, top, right, bottom) of a BoundingBox or of anything with a geometry
+    if(not isinstance(item, BoundingBox)):
+        item = item.geometry.boundingBox
+    return (item.left, item.top, item.left + item.width, item.top + item.height)
+
+# Uniform grid over the normalized page coordinates. Each item is registered
+# in every cell its bounding box touches, so region and nearest-neighbour
+# queries only visit the cells around the query box.
+class SpatialIndex:
+
+    def __init__(self, items, gridSize=32):
+        self._gridSize = gridSize
+        self._items = []
+        self._boxes = []
+        self._cells = {}
+        for item in items:
+            self.add(item)
+
+    def _cellRange(self, low, high):
+        last = self._gridSize - 1
+        return (min(max(int(low * self._gridSize), 0), last), min(max(int(high * self._gridSize), 0), last))
+
+    def add(self, item):
+        position = len(self._items)
+        box = _boxOf(item)
+        self._items.append(item)
+        self._boxes.append(box)
+        firstColumn, lastColumn = self._cellRange(box[0], box[2])
+        firstRow, lastRow = self._cellRange(box[1], box[3])
+        for column in range(firstColumn, lastColumn + 1):
+            for row in range(firstRow, lastRow + 1):
+                self._cells.setdefault((column, row), []).append(position)
+
+    @property
+    def items(self):
+        return self._items
+
+    def _positionsIn(self, columns, rows):
+        positions = set()
+        for column in columns:
+            for row in rows:
+                positions.update(self._cells.get((column, row), ()))
+        return positions
+
+    def inRegion(self, bbox, contained=False):
+        # Items overlapping bbox (or wholly inside it when contained is set), in insertion order
+        left, top, right, bottom = _boxOf(bbox)
+        firstColumn, lastColumn = self._cellRange(left, right)
+        firstRow, lastRow = self._cellRange(top, bottom)
+        results = []
+        for position in sorted(self._positionsIn(range(firstColumn, lastColumn + 1), range(firstRow, lastRow + 1))):
+            l, t, r, b = self._boxes[position]
+            if(contained):
+                hit = l >= left and t >= top and r <= right and b <= bottom
+            else:
+                hit = l < right and r > left and t < bottom and b > top
+            if(hit):
+                results.append(self._items[position])
+        return results
+
+    def nearestRightOf(self, item):
+        # Closest item whose vertical span overlaps item and whose centre lies to its right
+        left, top, right, bottom = _boxOf(item)
+        firstRow, lastRow = self._cellRange(top, bottom)
+        return self._nearest(item, self._cellRange(right, right)[0], lambda column: self._positionsIn([column], range(firstRow, lastRow + 1)),
+            lambda box: box[1] < bottom and box[3] > top and (box[0] + box[2]) / 2 > right,
+            lambda box: max(box[0] - right, 0.0))
+
+    def nearestBelow(self, item):
+        # Closest item whose horizontal span overlaps item and whose centre lies below it
+        left, top, right, bottom = _boxOf(item)
+        firstColumn, lastColumn = self._cellRange(left, right)
+        return self._nearest(item, self._cellRange(bottom, bottom)[0], lambda row: self._positionsIn(range(firstColumn, lastColumn + 1), [row]),
+            lambda box: box[0] < right and box[2] > left and (box[1] + box[3]) / 2 > bottom,
+            lambda box: max(box[1] - bottom, 0.0))
+
+    def _nearest(self, item, firstStep, positionsAt, accept, distance):
+        # Walks grid columns (or rows) away from item, stopping once the next
+        # band starts further away than the best match found so far
+        best = None
+        bestDistance = None
+        seen = set()
+        origin = firstStep / self._gridSize
+        for step in range(firstStep, self._gridSize):
+            if(best is not None and (step / self._gridSize) - origin > bestDistance + 1.0 / self._gridSize):
+                break
+            for position in sorted(positionsAt(step) - seen):
+                seen.add(position)
+                candidate = self._items[position]
+                if(candidate is item):
+                    continue
+                box = self._boxes[position]
+                if(accept(box)):
+                    d = distance(box)
+                    if(bestDistance is None or d < bestDistance):
+                        best = candidate
+                        bestDistance = d
+        return best
+
 class Page:
 
-    def __init__(self, blocks, blockMap):
+    def __init__(self, blocks, blockMap, lazy=False):
         self._blocks = blocks
+        self._blockMap = blockMap
         self._text = ""
         self._lines = []
         self._form = Form()
         self._tables = []
         self._content = []
-
-        self._parse(blockMap)
+        self._geometry = None
+        self._id = None
+        self._wordIndex = None
+        self._lineIndex = None
+
+        # Block types whose objects have already been materialized. In lazy mode
+        # lines, tables and form fields are only built the first time they are read.
+        self._parsedTypes = set()
+        self._contentById = {}
+
+        if(lazy):
+            self._content = None
+            for item in self._blocks:
+                if item["BlockType"] == "PAGE":
+                    self._geometry = Geometry(item['Geometry'])
+                    self._id = item['Id']
+                    break
+        else:
+            self._parse(blockMap)
 
     def __str__(self):
         s = "Page\n==========\n"
-        for item in self._content:
+        for item in self.content:
             s = s + str(item) + "\n"
         return s
 
-    def _parse(self, blockMap):
+    def _parse(self, blockMap, blockTypes=None):
+        if(blockTypes is None):
+            blockTypes = {"PAGE", "LINE", "TABLE", "KEY_VALUE_SET"}
+        blockTypes = blockTypes - self._parsedTypes
+        if(not blockTypes):
+            return
+        self._parsedTypes.update(blockTypes)
+
         for item in self._blocks:
+            if item["BlockType"] not in blockTypes:
+                continue
             if item["BlockType"] == "PAGE":
                 self._geometry = Geometry(item['Geometry'])
                 self._id = item['Id']
             elif item["BlockType"] == "LINE":
                 l = Line(item, blockMap)
                 self._lines.append(l)
-                self._content.append(l)
+                self._addContent(item, l)
                 self._text = self._text + l.text + '\n'
             elif item["BlockType"] == "TABLE":
                 t = Table(item, blockMap)
                 self._tables.append(t)
-                self._content.append(t)
+                self._addContent(item, t)
             elif item["BlockType"] == "KEY_VALUE_SET":
                 if 'KEY' in item['EntityTypes']:
                     f = Field(item, blockMap)
                     if(f.key):
                         self._form.addField(f)
-                        self._content.append(f)
+                        self._addContent(item, f)
                     else:
                         print("WARNING: Detected K/V where key does not have content. Excluding key from output.")
                         print(f)
                         print(item)
 
-    def getLinesInReadingOrder(self):
+    def _addContent(self, block, item):
+        if(self._content is None):
+            # Lazy page: content order is restored from the blocks once every type is parsed
+            self._contentById[block['Id']] = item
+        else:
+            self._content.append(item)
+
+    def iterLinesInReadingOrder(self, columnTolerance=0.0):
+        # Yields (columnIndex, line) column by column, top to bottom within each
+        # column. Lines are visited by position and matched against the columns
+        # found so far through an index of column left edges, so each line only
+        # checks the columns it can overlap. columnTolerance widens every column
+        # on both sides.
+        items = []
+        for line in self.lines:
+            bbox = line.geometry.boundingBox
+            items.append((bbox.top, bbox.left, bbox.left + bbox.width, line))
+        items.sort(key=lambda item: (item[0], item[1]))
+
         columns = []
-        lines = []
-        for item in self._lines:
-                column_found=False
-                for index, column in enumerate(columns):
-                    bbox_left = item.geometry.boundingBox.left
-                    bbox_right = item.geometry.boundingBox.left + item.geometry.boundingBox.width
-                    bbox_centre = item.geometry.boundingBox.left + item.geometry.boundingBox.width/2
-                    column_centre = column['left'] + column['right']/2
-                    if (bbox_centre > column['left'] and bbox_centre < column['right']) or (column_centre > bbox_left and column_centre < bbox_right):
-                        #Bbox appears inside the column
-                        lines.append([index, item.text])
-                        column_found=True
-                        break
-                if not column_found:
-                    columns.append({'left':item.geometry.boundingBox.left, 'right':item.geometry.boundingBox.left + item.geometry.boundingBox.width})
-                    lines.append([len(columns)-1, item.text])
-
-        lines.sort(key=lambda x: x[0])
-        return lines
-
-    def getTextInReadingOrder(self):
-        lines = self.getLinesInReadingOrder()
-        text = ""
-        for line in lines:
-            text = text + line[1] + '\n'
-        return text
+        columnLines = []
+        lefts = []
+        leftColumns = []
+        maxWidth = 0.0
+        for top, left, right, line in items:
+            centre = (left + right) / 2
+            found = None
+            # Columns starting right of this line (plus tolerance) cannot overlap it
+            i = bisect.bisect_left(lefts, right + columnTolerance)
+            while(i > 0):
+                i -= 1
+                if(lefts[i] + maxWidth + columnTolerance < left):
+                    break
+                index = leftColumns[i]
+                columnLeft, columnRight = columns[index]
+                columnCentre = (columnLeft + columnRight) / 2
+                if((columnLeft - columnTolerance < centre < columnRight + columnTolerance) or (left < columnCentre < right)):
+                    if(found is None or index < found):
+                        found = index
+            if(found is None):
+                found = len(columns)
+                columns.append((left, right))
+                columnLines.append([])
+                maxWidth = max(maxWidth, right - left)
+                position = bisect.bisect_right(lefts, left)
+                lefts.insert(position, left)
+                leftColumns.insert(position, found)
+            columnLines[found].append(line)
+
+        for index, lines in enumerate(columnLines):
+            for line in lines:
+                yield index, line
+
+    def getLinesInReadingOrder(self, columnTolerance=0.0):
+        return [[index, line.text] for index, line in self.iterLinesInReadingOrder(columnTolerance)]
+
+    def getTextInReadingOrder(self, columnTolerance=0.0):
+        return ''.join(line.text + '\n' for index, line in self.iterLinesInReadingOrder(columnTolerance))
 
     @property
     def blocks(self):
@@ -574,22 +1067,56 @@ class Page:
 
     @property
     def text(self):
+        self._parse(self._blockMap, {"LINE"})
         return self._text
 
     @property
     def lines(self):
+        self._parse(self._blockMap, {"LINE"})
         return self._lines
 
+    @property
+    def words(self):
+        return [word for line in self.lines for word in line.words]
+
+    def getSpatialIndex(self, lines=False):
+        # Grid index over the page words (or lines), built on first use
+        if(lines):
+            if(self._lineIndex is None):
+                self._lineIndex = SpatialIndex(self.lines)
+            return self._lineIndex
+        if(self._wordIndex is None):
+            self._wordIndex = SpatialIndex(self.words)
+        return self._wordIndex
+
+    def wordsInRegion(self, bbox, contained=False):
+        return self.getSpatialIndex().inRegion(bbox, contained)
+
+    def nearestRightOf(self, item, lines=False):
+        return self.getSpatialIndex(lines).nearestRightOf(item)
+
+    def nearestBelow(self, item, lines=False):
+        return self.getSpatialIndex(lines).nearestBelow(item)
+
     @property
     def form(self):
+        self._parse(self._blockMap, {"KEY_VALUE_SET"})
         return self._form
 
     @property
     def tables(self):
+        self._parse(self._blockMap, {"TABLE"})
         return self._tables
 
     @property
     def content(self):
+        if(self._content is None):
+            self._parse(self._blockMap)
+            self._content = []
+            for item in self._blocks:
+                if(item['Id'] in self._contentById):
+                    self._content.append(self._contentById[item['Id']])
+            self._contentById = {}
         return self._content
 
     @property
@@ -600,9 +1127,227 @@ class Page:
     def id(self):
         return self._id
 
+# Compact binary format used by Document.dump / Document.load. Everything is
+# little-endian and versioned:
+#
+#   header       magic, version, page count, string count and section offsets
+#   strings      (count + 1) uint64 offsets into a UTF-8 blob; every string in
+#                the document (ids, text, block types...) is stored once
+#   page table   (offset, length) per page, so one page can be read alone
+#   page         block count, point count, relationship count, child count,
+#                then packed int32/float64 arrays; relationships refer to other
+#                blocks by their index within the page instead of by Id
+_binaryMagic = b'TRPB'
+_binaryVersion = 1
+_binaryHeader = struct.Struct('<4sHHIIQQQi')
+_binaryPageHeader = struct.Struct('<IIII')
+_binaryPageEntry = struct.Struct('<QQ')
+_binaryKnownKeys = {'BlockType', 'Id', 'Text', 'Confidence', 'Geometry', 'Relationships', 'EntityTypes',
+    'SelectionStatus', 'RowIndex', 'ColumnIndex', 'RowSpan', 'ColumnSpan', 'Page'}
+_binaryIntFields = 15
+_binaryFloatFields = 5
+
+def _binaryArray(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if(sys.byteorder == 'big'):
+        values.byteswap()
+    return values
+
+def _binaryBytes(values):
+    if(sys.byteorder == 'big'):
+        values = array(values.typecode, values)
+        values.byteswap()
+    data = values.tobytes()
+    return data + b'\0' * (-len(data) % 8)
+
+def _dumpDocument(fp, documentPages, metadata):
+    strings = {}
+
+    def intern(value):
+        if(value is None):
+            return -1
+        index = strings.get(value)
+        if(index is None):
+            index = strings[value] = len(strings)
+        return index
+
+    pages = []
+    for documentPage in documentPages:
+        blocks = documentPage['Blocks']
+        positions = {block['Id']: position for position, block in enumerate(blocks)}
+        ints = array('i')
+        floats = array('d')
+        points = array('d')
+        relationships = array('i')
+        children = array('i')
+        for block in blocks:
+            extras = {key: value for key, value in block.items() if key not in _binaryKnownKeys}
+            geometry = block.get('Geometry')
+            if(geometry):
+                bbox = geometry['BoundingBox']
+                floats.extend((block.get('Confidence', math.nan), bbox['Left'], bbox['Top'], bbox['Width'], bbox['Height']))
+                polygonStart, polygonCount = len(points) // 2, len(geometry['Polygon'])
+                for point in geometry['Polygon']:
+                    points.extend((point['X'], point['Y']))
+            else:
+                floats.extend((block.get('Confidence', math.nan), math.nan, math.nan, math.nan, math.nan))
+                polygonStart, polygonCount = 0, -1
+            relationshipStart = len(relationships) // 3
+            for rs in block.get('Relationships') or []:
+                relationships.extend((intern(rs['Type']), len(children), len(rs['Ids'])))
+                for rid in rs['Ids']:
+                    children.append(positions[rid] if rid in positions else -intern(rid) - 2)
+            ints.extend((intern(block['BlockType']), intern(block['Id']), intern(block.get('Text')),
+                intern(json.dumps(block['EntityTypes']) if 'EntityTypes' in block else None),
+                intern(block.get('SelectionStatus')), block.get('RowIndex', -1), block.get('ColumnIndex', -1),
+                block.get('RowSpan', -1), block.get('ColumnSpan', -1), block.get('Page', -1),
+                intern(json.dumps(extras) if extras else None), polygonStart, polygonCount,
+                relationshipStart, len(relationships) // 3 - relationshipStart))
+        pages.append(_binaryPageHeader.pack(len(blocks), len(points) // 2, len(relationships) // 3, len(children))
+            + _binaryBytes(ints) + _binaryBytes(floats) + _binaryBytes(points) + _binaryBytes(relationships) + _binaryBytes(children))
+
+    metadataIndex = intern(json.dumps(metadata) if metadata else None)
+    stringData = [value.encode('utf-8') for value in strings]
+    offsets = array('Q', [0])
+    for data in stringData:
+        offsets.append(offsets[-1] + len(data))
+    blob = b''.join(stringData)
+    blob = blob + b'\0' * (-len(blob) % 8)
+
+    stringOffsetsPos = _binaryHeader.size + (-_binaryHeader.size % 8)
+    stringDataPos = stringOffsetsPos + len(offsets) * 8
+    pageTablePos = stringDataPos + len(blob)
+    position = pageTablePos + len(pages) * _binaryPageEntry.size
+    pageTable = b''
+    for page in pages:
+        pageTable = pageTable + _binaryPageEntry.pack(position, len(page))
+        position += len(page)
+
+    header = _binaryHeader.pack(_binaryMagic, _binaryVersion, 0, len(pages), len(strings),
+        stringOffsetsPos, stringDataPos, pageTablePos, metadataIndex)
+    fp.write(header + b'\0' * (stringOffsetsPos - len(header)))
+    fp.write(_binaryBytes(offsets))
+    fp.write(blob)
+    fp.write(pageTable)
+    for page in pages:
+        fp.write(page)
+
+class _BinaryDocumentReader:
+    # Reads the format written by _dumpDocument from a memory map (or bytes).
+    # Strings and pages are decoded only when asked for.
+    def __init__(self, buffer):
+        if(len(buffer) < _binaryHeader.size):
+            raise ValueError("Not a trp binary document (only {} bytes)".format(len(buffer)))
+        self._buffer = buffer
+        magic, version, flags, self.pageCount, self._stringCount, self._stringOffsetsPos, self._stringDataPos, \
+            self._pageTablePos, self._metadataIndex = _binaryHeader.unpack_from(buffer, 0)
+        if(magic != _binaryMagic):
+            raise ValueError("Not a trp binary document")
+        if(version != _binaryVersion):
+            raise ValueError("Unsupported trp binary document version {}".format(version))
+        if(self._pageTablePos + self.pageCount * _binaryPageEntry.size > len(buffer)):
+            raise ValueError("Truncated trp binary document")
+        self._strings = [None] * self._stringCount
+        self._entityTypes = {}
+
+    def string(self, index):
+        if(index < 0):
+            return None
+        value = self._strings[index]
+        if(value is None):
+            start, end = struct.unpack_from('<QQ', self._buffer, self._stringOffsetsPos + index * 8)
+            value = self._strings[index] = bytes(self._buffer[self._stringDataPos + start:self._stringDataPos + end]).decode('utf-8')
+        return value
+
+    def entityTypes(self, index):
+        # Few distinct EntityTypes lists exist, so decode each once and copy it
+        value = self._entityTypes.get(index)
+        if(value is None):
+            value = self._entityTypes[index] = json.loads(self.string(index))
+        return list(value)
+
+    @property
+    def metadata(self):
+        if(self._metadataIndex < 0):
+            return None
+        return json.loads(self.string(self._metadataIndex))
+
+    def pageBlocks(self, pageIndex):
+        if(not 0 <= pageIndex < self.pageCount):
+            raise IndexError("page index out of range")
+        offset, length = _binaryPageEntry.unpack_from(self._buffer, self._pageTablePos + pageIndex * _binaryPageEntry.size)
+        data = bytes(self._buffer[offset:offset + length])
+        blockCount, pointCount, relationshipCount, childCount = _binaryPageHeader.unpack_from(data, 0)
+
+        position = _binaryPageHeader.size
+        sections = []
+        for typecode, count in (('i', blockCount * _binaryIntFields), ('d', blockCount * _binaryFloatFields),
+                ('d', pointCount * 2), ('i', relationshipCount * 3), ('i', childCount)):
+            size = count * array(typecode).itemsize
+            sections.append(_binaryArray(typecode, data[position:position + size]).tolist())
+            position += size + (-size % 8)
+        ints, floats, points, relationships, children = sections
+
+        string = self.string
+        ids = [string(ints[i * _binaryIntFields + 1]) for i in range(blockCount)]
+        blocks = []
+        for i in range(blockCount):
+            (blockType, blockId, text, entityTypes, selectionStatus, rowIndex, columnIndex, rowSpan, columnSpan,
+                page, extras, polygonStart, polygonCount, relationshipStart, relationshipLength) = ints[i * _binaryIntFields:(i + 1) * _binaryIntFields]
+            confidence, left, top, width, height = floats[i * _binaryFloatFields:(i + 1) * _binaryFloatFields]
+            block = {'BlockType': string(blockType)}
+            if(confidence == confidence):  # NaN marks a missing Confidence
+                block['Confidence'] = confidence
+            if(text >= 0):
+                block['Text'] = string(text)
+            if(polygonCount >= 0):
+                block['Geometry'] = {
+                    'BoundingBox': {'Width': width, 'Height': height, 'Left': left, 'Top': top},
+                    'Polygon': [{'X': points[2 * p], 'Y': points[2 * p + 1]} for p in range(polygonStart, polygonStart + polygonCount)]
+                }
+            block['Id'] = ids[i]
+            if(relationshipLength):
+                rels = []
+                for r in range(relationshipStart, relationshipStart + relationshipLength):
+                    relType, childStart, childLength = relationships[r * 3:r * 3 + 3]
+                    rels.append({'Type': string(relType),
+                        'Ids': [ids[c] if c >= 0 else string(-c - 2) for c in children[childStart:childStart + childLength]]})
+                block['Relationships'] = rels
+            if(entityTypes >= 0):
+                block['EntityTypes'] = self.entityTypes(entityTypes)
+            if(selectionStatus >= 0):
+                block['SelectionStatus'] = string(selectionStatus)
+            for key, value in (('RowIndex', rowIndex), ('ColumnIndex', columnIndex), ('RowSpan', rowSpan), ('ColumnSpan', columnSpan), ('Page', page)):
+                if(value >= 0):
+                    block[key] = value
+            if(extras >= 0):
+                block.update(json.loads(string(extras)))
+            blocks.append(block)
+        return blocks
+
+def _openBinaryDocument(fp):
+    # Memory-maps real files read from their start so untouched pages are
+    # never read from disk. Anything else (a file positioned past its start, a
+    # stream without a file number, a file too short for the header) is read
+    # into memory instead, and short input fails the header check.
+    try:
+        fileno = fp.fileno()
+        mappable = fp.tell() == 0 and os.fstat(fileno).st_size >= _binaryHeader.size
+    except (AttributeError, OSError, ValueError):
+        mappable = False
+    if(not mappable):
+        return _BinaryDocumentReader(fp.read()), None
+    mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    try:
+        return _BinaryDocumentReader(mapped), mapped
+    except Exception:
+        mapped.close()
+        raise
+
 class Document:
 
-    def __init__(self, responsePages):
+    def __init__(self, responsePages, lazy=False):
 
         if(not isinstance(responsePages, list)):
             rps = []
@@ -610,19 +1355,25 @@ class Document:
             responsePages = rps
 
         self._responsePages = responsePages
-        self._pages = []
+        self._lazy = lazy
+        self._pages = None
+        self._responseDocumentPages = None
+        self._blockMap = None
 
-        self._parse()
+        # In lazy mode the block map and pages are only built when first needed,
+        # and each page defers building its lines, tables and form until read.
+        if(not lazy):
+            self._parse()
 
     def __str__(self):
         s = "\nDocument\n==========\n"
-        for p in self._pages:
+        for p in self.pages:
             s = s + str(p) + "\n\n"
         return s
 
     def _parseDocumentPagesAndBlockMap(self):
 
-        blockMap = {}
+        blockMap = BlockMap()
 
         documentPages = []
         documentPage = None
@@ -642,11 +1393,79 @@ class Document:
             documentPages.append({"Blocks" : documentPage})
         return documentPages, blockMap
 
+    @staticmethod
+    def iterPages(responsePages, lazy=False):
+        # Builds pages from an iterable of response chunks (for example the
+        # NextToken pages of GetDocumentAnalysis) and yields each Page as soon
+        # as the next PAGE block shows it is complete. Every page gets its own
+        # block map, so memory stays bounded by the largest page.
+        if(isinstance(responsePages, dict)):
+            responsePages = [responsePages]
+
+        pageBlocks = None
+        blockMap = None
+        for response in responsePages:
+            for block in response['Blocks']:
+                if(block['BlockType'] == 'PAGE'):
+                    if(pageBlocks):
+                        yield Page(pageBlocks, blockMap, lazy=lazy)
+                    pageBlocks = []
+                    blockMap = BlockMap()
+                elif(pageBlocks is None):
+                    continue
+                pageBlocks.append(block)
+                blockMap[block['Id']] = block
+        if(pageBlocks):
+            yield Page(pageBlocks, blockMap, lazy=lazy)
+
+    @staticmethod
+    def loadPages(fp, lazy=False, chunkSize=65536):
+        # Streams pages out of a stored Textract JSON file without loading the
+        # whole response; see iterJsonBlocks and iterPages
+        return Document.iterPages([{'Blocks': iterJsonBlocks(fp, chunkSize)}], lazy=lazy)
+
+    def dump(self, fp):
+        # Writes the parsed blocks to a binary file object in the compact trp format
+        metadata = None
+        if(self._responsePages and 'DocumentMetadata' in self._responsePages[0]):
+            metadata = self._responsePages[0]['DocumentMetadata']
+        _dumpDocument(fp, self.pageBlocks, metadata)
+
+    @staticmethod
+    def load(fp, lazy=False):
+        # Rebuilds a Document from a file written by dump
+        reader, mapped = _openBinaryDocument(fp)
+        try:
+            blocks = []
+            for pageIndex in range(reader.pageCount):
+                blocks.extend(reader.pageBlocks(pageIndex))
+            response = {'Blocks': blocks}
+            if(reader.metadata is not None):
+                response['DocumentMetadata'] = reader.metadata
+        finally:
+            if(mapped is not None):
+                mapped.close()
+        return Document(response, lazy=lazy)
+
+    @staticmethod
+    def loadPage(fp, pageIndex, lazy=False):
+        # Decodes a single page (0-based) of a file written by dump
+        reader, mapped = _openBinaryDocument(fp)
+        try:
+            blocks = reader.pageBlocks(pageIndex)
+        finally:
+            if(mapped is not None):
+                mapped.close()
+        return Page(blocks, BlockMap((block['Id'], block) for block in blocks), lazy=lazy)
+
     def _parse(self):
+        if(self._pages is not None):
+            return
 
         self._responseDocumentPages, self._blockMap = self._parseDocumentPagesAndBlockMap()
+        self._pages = []
         for documentPage in self._responseDocumentPages:
-            page = Page(documentPage["Blocks"], self._blockMap)
+            page = Page(documentPage["Blocks"], self._blockMap, lazy=self._lazy)
             self._pages.append(page)
 
     @property
@@ -655,14 +1474,187 @@ class Document:
 
     @property
     def pageBlocks(self):
+        self._parse()
         return self._responseDocumentPages
 
     @property
     def pages(self):
+        self._parse()
         return self._pages
 
     def getBlockById(self, blockId):
+        self._parse()
         block = None
         if(self._blockMap and blockId in self._blockMap):
             block = self._blockMap[blockId]
         return block
+
+class ExtractedField:
+    __slots__ = ('_key', '_value', '_keyConfidence', '_valueConfidence', '_page')
+
+    def __init__(self, key, value, keyConfidence, valueConfidence, page):
+        self._key = key
+        self._value = value
+        self._keyConfidence = keyConfidence
+        self._valueConfidence = valueConfidence
+        self._page = page
+
+    def __str__(self):
+        return "Key: {}, Value: {}".format(self._key, self._value)
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def value(self):
+        return self._value
+
+    @property
+    def keyConfidence(self):
+        return self._keyConfidence
+
+    @property
+    def valueConfidence(self):
+        return self._valueConfidence
+
+    @property
+    def confidence(self):
+        if(self._valueConfidence is None):
+            return self._keyConfidence
+        return min(self._keyConfidence, self._valueConfidence)
+
+    @property
+    def page(self):
+        return self._page
+
+# Pulls selected form fields straight out of raw Textract responses. Only
+# KEY_VALUE_SET blocks and the WORD/SELECTION_ELEMENT blocks they point at are
+# looked at, so no Page, Line, Table or Geometry objects are built. Keys match
+# the same way as Form.findField: exact, containing or within maxDistance edits
+# after normalization. Results are ranked best match first, then document order.
+class FieldExtractor:
+
+    def __init__(self, keys, maxDistance=2):
+        if(isinstance(keys, str)):
+            keys = [keys]
+        self._keys = list(keys)
+        self._searchKeys = [normalizeKey(key) for key in self._keys]
+        self._maxDistance = maxDistance
+
+    @property
+    def keys(self):
+        return self._keys
+
+    def extract(self, responsePages):
+        collector = self.collector()
+        collector.add(responsePages)
+        return collector.results()
+
+    def collector(self):
+        # Accumulates matches over several calls, for example one per document
+        # page as the pages of an asynchronous analysis arrive
+        return FieldCollector(self)
+
+    def _collect(self, responsePages, matched, pageNumber):
+        # Appends (rank, order, field) to matched[key] for every form key that
+        # matches a search key, and returns the number of the last page seen
+        if(not isinstance(responsePages, list)):
+            responsePages = [responsePages]
+
+        # First pass: key/value blocks and the ids of the content they reference
+        keyBlocks = []
+        valueBlocks = {}
+        contentIds = set()
+        for response in responsePages:
+            for block in response['Blocks']:
+                blockType = block['BlockType']
+                if(blockType == 'PAGE'):
+                    pageNumber += 1
+                elif(blockType == 'KEY_VALUE_SET'):
+                    if('KEY' in block['EntityTypes']):
+                        keyBlocks.append((pageNumber, block))
+                    else:
+                        valueBlocks[block['Id']] = block
+                    for rs in block.get('Relationships') or []:
+                        if(rs['Type'] == 'CHILD'):
+                            contentIds.update(rs['Ids'])
+
+        # Second pass: only the words and selection elements used by the form
+        contentMap = {}
+        for response in responsePages:
+            for block in response['Blocks']:
+                if(block['Id'] in contentIds):
+                    contentMap[block['Id']] = block
+
+        for keyPage, block in keyBlocks:
+            keyText = None
+            valueIds = []
+            for rs in block.get('Relationships') or []:
+                if(rs['Type'] == 'CHILD'):
+                    keyText = self._getText(rs['Ids'], contentMap)
+                elif(rs['Type'] == 'VALUE'):
+                    valueIds.extend(rs['Ids'])
+            if(not keyText):
+                continue
+
+            normalizedKey = normalizeKey(keyText)
+            matches = []
+            for key, searchKey in zip(self._keys, self._searchKeys):
+                rank = _matchKey(searchKey, normalizedKey, self._maxDistance)
+                if(rank is not None):
+                    matches.append((key, rank))
+            if(not matches):
+                continue
+
+            valueText = None
+            valueConfidence = None
+            for vid in valueIds:
+                vkvs = valueBlocks.get(vid)
+                if(vkvs and 'VALUE' in vkvs['EntityTypes']):
+                    valueConfidence = vkvs['Confidence']
+                    for vitem in vkvs.get('Relationships') or []:
+                        if(vitem['Type'] == 'CHILD'):
+                            valueText = self._getText(vitem['Ids'], contentMap)
+
+            field = ExtractedField(keyText, valueText, block['Confidence'], valueConfidence, keyPage)
+            for key, rank in matches:
+                matched[key].append((rank, len(matched[key]), field))
+        return pageNumber
+
+    def _getText(self, ids, contentMap):
+        words = []
+        selectionStatus = None
+        for eid in ids:
+            cb = contentMap.get(eid)
+            if(cb is None):
+                continue
+            if(cb['BlockType'] == 'WORD'):
+                words.append(cb['Text'])
+            elif(cb['BlockType'] == 'SELECTION_ELEMENT'):
+                selectionStatus = cb['SelectionStatus']
+        if(words):
+            return ' '.join(words)
+        return selectionStatus
+
+class FieldCollector:
+    # Matches of a FieldExtractor gathered over several calls to add. Each call
+    # must hold whole document pages, since key/value pairs never span pages.
+    def __init__(self, extractor):
+        self._extractor = extractor
+        self._matched = {key: [] for key in extractor.keys}
+        self._pageNumber = 0
+
+    def add(self, responsePages):
+        self._pageNumber = self._extractor._collect(responsePages, self._matched, self._pageNumber)
+
+    @property
+    def pageCount(self):
+        return self._pageNumber
+
+    def results(self):
+        # Fields per search key, best match first
+        results = {}
+        for key, matches in self._matched.items():
+            results[key] = [match[2] for match in sorted(matches, key=lambda match: match[:2])]
+        return results
@@ -14,49 +14,236 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
-import boto3
-from trp import Document
+import time
+import aws_clients
+import decision_engine
+import extraction
+import image_prep
+import quality
+import textract_async
+import textract_cache
+import textract_guard
+import time_budget
 
 
-def evaluate_loan(imagebytes, busi_approval):
-    # Amazon Textract client
-    textract = boto3.client('textract')
-    # Call Amazon Textract
-    response = textract.analyze_document(
-        Document={
-            'Bytes': imagebytes
-        },
-        FeatureTypes=["FORMS"])
+# Textract features requested for wage documents
+FEATURE_TYPES = ["FORMS"]
 
+
+# Runs Textract ahead of fulfillment so the result is already cached. urlfile
+# lets a success clear the failure marker an earlier attempt left for it.
+def prefetch_document(imagebytes, digest=None, urlfile=None):
+    textract = textract_guard.guard(aws_clients.get_client('textract'))
+    try:
+        textract_cache.analyze_document(textract, imagebytes, FEATURE_TYPES, digest=digest, prepare=image_prep.normalize_image,
+            urlfile=urlfile)
+    finally:
+        textract.emit_metrics()
+
+
+# A document that cannot be used; the message is what the customer is told
+class Referral(Exception):
+    pass
+
+
+# A document that was not evaluated because the application has more than
+# the pipeline reads
+class Skipped(Referral):
+    pass
+
+
+# timeout bounds the Textract stage in seconds; when it runs out
+# time_budget.BudgetExceeded (or textract_async.AnalysisTimeout for PDFs) is
+# raised so the caller can hand the rest off instead of blocking the customer.
+# textract replaces the guarded AWS client, for example with a
+# textract_stub.StubTextract when replaying documents offline.
+def evaluate_loan(imagebytes, busi_approval, prefetch_wait=0, digest=None, timeout=None, loan_type=None,
+                  textract=None, timings=None, refer_unavailable=True):
+    reader = DocumentReader()
+    try:
+        response = analyze(imagebytes, prefetch_wait, digest, timeout, textract, timings,
+            refer_unavailable=refer_unavailable, reader=reader)
+    except Referral as e:
+        return referral(str(e))
+    return evaluate_response(response, busi_approval, loan_type, timings, reader=reader)
+
+
+# Returns the Textract response for a document, raising Referral when it
+# cannot be analyzed. urlfile is where the document was downloaded from, so a
+# failed analysis of it elsewhere cuts the wait short and a failure here is
+# marked for whoever waits on this analysis. With refer_unavailable
+# False, Textract being unavailable or a failed analysis job is raised as is
+# instead of referring the customer, so a batch run can retry it. reader, a
+# DocumentReader, parses the pages of a multi-page analysis as they arrive.
+def analyze(imagebytes, prefetch_wait=0, digest=None, timeout=None, textract=None, timings=None, urlfile=None,
+            refer_unavailable=True, reader=None):
+    if textract is None:
+        # Amazon Textract client, shared across warm invocations behind admission control
+        textract = textract_guard.guard(aws_clients.get_client('textract'))
+    if timeout is not None:
+        # Never spend more than half the stage waiting on a prefetch
+        prefetch_wait = min(prefetch_wait, timeout / 2)
+    async_timeout = timeout if timeout is not None else textract_async.ANALYSIS_TIMEOUT
+    # Call Amazon Textract, reusing the result for documents seen before
+    start = time.perf_counter()
+    try:
+        return time_budget.run_with_timeout(
+            lambda: textract_cache.analyze_document(textract, imagebytes, FEATURE_TYPES, digest=digest,
+                wait_seconds=prefetch_wait, prepare=image_prep.normalize_image, async_timeout=async_timeout,
+                urlfile=urlfile, on_page=reader.add if reader is not None else None),
+            timeout, "analyze")
+    except image_prep.ImageTooLarge as e:
+        print("Image rejected: {}".format(str(e)))
+        raise Referral("The image you uploaded is too detailed for me to process. I'll transfer you to an agent for further assistance.")
+    except image_prep.ImageRejected as e:
+        print("Image rejected: {}".format(str(e)))
+        raise Referral("The image you uploaded is too small for me to read. I'll transfer you to an agent for further assistance.")
+    except textract_async.AnalysisFailed as e:
+        if not refer_unavailable:
+            raise
+        print("Document analysis incomplete: {}".format(str(e)))
+        raise Referral("Your document is taking longer than expected to process. I'll transfer you to an agent for further assistance.")
+    except textract_guard.DocumentRejected as e:
+        print("Document rejected by Textract: {}".format(str(e)))
+        raise Referral("I wasn't able to open the document you uploaded. I'll transfer you to an agent for further assistance.")
+    except textract_guard.TextractUnavailable as e:
+        if not refer_unavailable:
+            raise
+        print("Textract unavailable: {}".format(str(e)))
+        raise Referral("We're reviewing a lot of applications right now, so I couldn't check your document. I'll transfer you to an agent for further assistance.")
+    finally:
+        if isinstance(textract, textract_guard.GuardedTextract):
+            textract.emit_metrics()
+        if timings is not None:
+            timings["analyze"] = time.perf_counter() - start
+
+
+# Parsing and decision for a Textract response, also used to replay stored
+# responses. When timings is a dict, the seconds spent in the parse and decide
+# stages are recorded in it. Always returns a decision or a referral; the
+# extracted fields are included under "documents".
+def evaluate_response(response, busi_approval, loan_type=None, timings=None, profile=extraction.W2_PROFILE,
+                      reader=None):
+    start = time.perf_counter()
+    try:
+        document = read_document(response, profile, reader)
+    except Referral as e:
+        document = e
+    parsed = time.perf_counter()
+    decision = decide_income([document], busi_approval, loan_type)
+    if timings is not None:
+        timings["parse"] = parsed - start
+        timings["decide"] = time.perf_counter() - parsed
+    return decision
+
+
+# Parses a document a page at a time: quality statistics and form matches are
+# gathered as each page arrives, and the result is built once all are in
+class DocumentReader:
+
+    def __init__(self, profile=extraction.W2_PROFILE):
+        self.profile = profile
+        self.pages = 0
+        self._statistics = []
+        self._extractor = extraction.StreamingExtractor(profile)
+
+    # page is one document page, or a whole response
+    def add(self, page):
+        self._statistics.extend(quality.page_statistics(page, first_page=len(self._statistics) + 1))
+        self._extractor.add(page)
+        self.pages += len(page) if isinstance(page, list) else 1
+
+    # True when every page of response has already been added
+    def covers(self, response):
+        return isinstance(response, list) and 0 < self.pages == len(response)
+
+    def read(self):
+        # Reject unreadable documents before spending time on the fallbacks
+        accepted, reasons, pages = quality.assess_pages(self._statistics)
+        if not accepted:
+            print("Document rejected: {}".format("; ".join(reasons)))
+            raise Referral("I wasn't able to read your document clearly. I'll transfer you to an agent for further assistance.")
+
+        document = self._extractor.result()
+        for name, extracted in document.values.items():
+            print("Field: {}, Key: {}, Value: {}, Confidence: {}".format(name, extracted.key, extracted.text, extracted.confidence))
+        return document
+
+
+# Returns the fields of the profile as an extraction.ExtractionResult, raising
+# Referral for unreadable documents. reader holds the pages already parsed
+# while the analysis was running; without one the response is parsed here.
+def read_document(response, profile=extraction.W2_PROFILE, reader=None):
     # print(response)
-    doc = Document(response)
-
-    for page in doc.pages:
-        # Get field by key
-        key = "Social security wages"
-        field = page.form.getFieldByKey(key)
-        if field:
-            print("Key: {}, Value: {}".format(field.key, field.value))
-    
-        # Search fields by key
-        fields = page.form.searchFieldsByKey(key)
-        for field in fields:
-            print("Key: {}, Value: {}".format(field.key, field.value))
-            wagesstring = str(field.value)
-            wagesstring = wagesstring.replace(",", '')
-            wagesint = int(float(wagesstring))
-            return makedecision(busi_approval, wagesint)
-
-
-def makedecision(busi_approval, wagesint):
-    if (wagesint * .5) > busi_approval:
-        creditdecision = "Approved"
+    if reader is None or not reader.covers(response):
+        reader = DocumentReader(profile)
+        reader.add(response)
+    return reader.read()
+
+
+# Decides on the combined wages of all readable documents. documents holds
+# extraction results, and exceptions (such as Referral) for documents that
+# could not be used. An application that would be denied is referred instead when some of
+# its documents could not be read, since they might have changed the outcome.
+def decide_income(documents, busi_approval, loan_type=None):
+    results = [document for document in documents if isinstance(document, extraction.ExtractionResult)]
+    readable = [result for result in results if "wages" in result]
+    if not readable:
+        referrals = [document for document in documents if isinstance(document, Referral)]
+        if referrals:
+            decision = referral(str(referrals[0]))
+        else:
+            print("Wages not found, missing fields: {}".format(", ".join(results[0].missing if results else [])))
+            decision = referral("I couldn't find your wages on the document you uploaded. I'll transfer you to an agent for further assistance.")
+    else:
+        wages, confidence = combine_wages(readable)
+        decision = makedecision(busi_approval, int(wages), loan_type, confidence)
+        if decision["response"] == "Denied" and len(readable) < len(documents):
+            print("Denial referred, {} of {} documents unreadable".format(len(documents) - len(readable), len(documents)))
+            skipped = [document for document in documents if isinstance(document, Skipped)]
+            if skipped:
+                decision = referral(str(skipped[0]))
+            else:
+                decision = referral("I couldn't read all of the documents you uploaded. I'll transfer you to an agent for further assistance.")
+    decision["documents"] = [result.as_dict() for result in results]
+    return decision
+
+
+# Total wages and the lowest wage confidence over the documents. Only the
+# most recent tax year counts (documents without a year are assumed to be
+# current), and the same W-2 uploaded twice is counted once.
+def combine_wages(results):
+    years = [result.get("tax_year") for result in results if result.get("tax_year") is not None]
+    latest = max(years) if years else None
+    seen = set()
+    wages = 0.0
+    confidences = []
+    for result in results:
+        year = result.get("tax_year")
+        if year is not None and year != latest:
+            continue
+        identity = (result.get("employer_ein"), year, result.get("wages"))
+        if identity[0] is not None:
+            if identity in seen:
+                continue
+            seen.add(identity)
+        wages += result.get("wages")
+        if result.confidence("wages") is not None:
+            confidences.append(result.confidence("wages"))
+    return wages, min(confidences) if confidences else None
+
+
+# The decision rules live in decision_rules.json; without a loan type the
+# default rule applies
+def makedecision(busi_approval, wagesint, loan_type=None, confidence=None):
+    creditdecision, reason = decision_engine.decide(busi_approval, wagesint, loan_type, confidence)
+    if creditdecision == "Approved":
         message = "Congratulations! Your loan is approved. I'll now tranfer you to an agent for help with processing your loan."
-        print(creditdecision)
+    elif creditdecision == "Referred":
+        message = "I couldn't read your wages clearly enough to make a decision. I'll transfer you to an agent for further assistance."
     else:
-        creditdecision = "Denied"
         message = "Your load has been denied. I'll transfer you to an agent for further assistance."
-        print(creditdecision)
+    print("{} ({})".format(creditdecision, reason))
 
     return {
         "response": creditdecision,
@@ -64,3 +251,12 @@ def makedecision(busi_approval, wagesint):
               "message": message,
             }
         }
+
+
+def referral(message):
+    return {
+        "response": "Referred",
+        "body": {
+              "message": message,
+            }
+        }
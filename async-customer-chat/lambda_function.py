@@ -14,24 +14,20 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
-import boto3
 import json
 import logging
+import aws_clients
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize boto3 client at global scope
-connectClient = boto3.client('connect')
-
-
 def start_chat_contact(body):
     contact_flow_id = body.get("ContactFlowId", None)
     instance_id = body.get("InstanceId", None)
     logger.info('InstanceId: %s, FlowId: %s', instance_id, contact_flow_id)
 
     try:
-        response = connectClient.start_chat_contact(
+        response = aws_clients.get_client('connect').start_chat_contact(
             InstanceId=instance_id,
             ContactFlowId=contact_flow_id,
             Attributes={
@@ -1,4 +1,4 @@
-import boto3
+import aws_clients
 import logging
 import io
 
@@ -12,11 +12,6 @@ source_dir = "deployment/"
 file_list = ["js/amazon-connect-chat-interface.js"]
 index_file = "index.html"
 
-# boto clients
-connect_client = boto3.client("connect")
-s3_client = boto3.client("s3")
-
-
 # This function moves any static files to the website defined in the list above.
 def copy_website_files(resource_properties):
     dest_bucket = resource_properties["destS3Bucket"]
@@ -48,7 +43,7 @@ def copy_website_files(resource_properties):
         
         logger.info("Copying %s to bucket: %s key: %s", copy_source, dest_bucket, dest_key)
         try:
-            resp = s3_client.put_object(
+            resp = aws_clients.get_client('s3').put_object(
                 Bucket=dest_bucket,
                 Body=filedat,
                 Key=dest_key,
@@ -69,7 +64,7 @@ def associate_bot(resource_properties):
     aliasarn = resource_properties["botAliasArn"]
     instance = resource_properties["instanceId"]    
     try:
-        resp = connect_client.associate_bot(
+        resp = aws_clients.get_client('connect').associate_bot(
             InstanceId=instance,
             LexV2Bot={
                 "AliasArn": aliasarn
@@ -90,7 +85,7 @@ def disassociate_bot(resource_properties):
     aliasarn = resource_properties["botAliasArn"]
     instance = resource_properties["instanceId"]
     try:
-        resp = connect_client.disassociate_bot(
+        resp = aws_clients.get_client('connect').disassociate_bot(
             InstanceId=instance,
             LexV2Bot={
                 "AliasArn": aliasarn
@@ -143,7 +138,7 @@ def config_index_file(resource_properties):
     
     # Put modified file
     try:
-        resp = s3_client.put_object(
+        resp = aws_clients.get_client('s3').put_object(
             Bucket=dest_bucket,
             Key=dest_key_file,
             Body=file_data_io.read(),
@@ -17,17 +17,15 @@
 import os
 import json
 import logging
-import boto3
+import aws_clients
+import document_urls
 import base64
 import gzip
+import time
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize boto3 client at global scope for connection reuse
-lex_client = boto3.client('lexv2-runtime')
-
-
 def lambda_handler(event, context):
     # Step 1: Retrieve/validate input values
     try:
@@ -71,6 +69,7 @@ def lambda_handler(event, context):
         return close("error", error_message, {})
 
     # Step 3: Get existing Lex session attributes, if available
+    lex_client = aws_clients.get_client('lexv2-runtime')
     try:
         getresp = lex_client.get_session(
             botId=lex_bot_id,
@@ -99,6 +98,21 @@ def lambda_handler(event, context):
         message = 'lex get session'
         
     elif action == "put":
+        # Session attributes are strings, so document lists are stored as JSON
+        for name in ("urlfile", "urlfiles"):
+            if isinstance(attributes.get(name, None), list):
+                attributes[name] = json.dumps(attributes[name])
+
+        # Start analyzing newly uploaded wage documents right away, but only
+        # those fulfillment will evaluate
+        known = set(document_urls.get_urlfiles(session_state["sessionAttributes"]))
+        merged = dict(session_state["sessionAttributes"])
+        merged.update(attributes)
+        evaluated = document_urls.get_urlfiles(merged)[:document_urls.MAX_DOCUMENTS]
+        new_urlfiles = [urlfile for urlfile in evaluated if urlfile not in known]
+        if new_urlfiles and all([start_prefetch(urlfile) for urlfile in new_urlfiles]):
+            attributes["prefetchRequested"] = str(time.time())
+
         # Update null slots to empty dict. put_session does not like null.
         for slot in slots:
             if not slots[slot]:
@@ -147,6 +161,25 @@ def lambda_handler(event, context):
     return close(status, message, session_attributes)
     
 
+# Asynchronously invokes the Lex bot Lambda to download and analyze the document
+# before fulfillment needs it. Failures only cost the head start.
+def start_prefetch(urlfile):
+    function_name = os.environ.get('PREFETCH_FUNCTION_NAME', None)
+    if not function_name:
+        return False
+    try:
+        aws_clients.get_client('lambda').invoke(
+            FunctionName=function_name,
+            InvocationType='Event',
+            Payload=json.dumps({"prefetch": {"urlfile": urlfile}}).encode('utf-8')
+        )
+    except Exception as e:
+        logger.error('prefetch invoke error: ' + str(e))
+        return False
+    logger.info('prefetch started for uploaded document')
+    return True
+
+
 def close(status, message_text, attributes):
     return_value = {
         "statusCode": 200,
@@ -0,0 +1,92 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import logging
+import threading
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger()
+
+# Client settings per service. Adjust as necessary.
+# Timeouts are in seconds; max_attempts includes the first call.
+DEFAULT_SETTINGS = {
+    "connect_timeout": 2,
+    "read_timeout": 10,
+    "max_attempts": 3,
+    "retry_mode": "adaptive",
+    "max_pool_connections": 10
+}
+
+SERVICE_SETTINGS = {
+    # Synchronous AnalyzeDocument on a phone photo can take several seconds.
+    # The bot's Textract guard does the rate limiting and retries and tracks
+    # them, so botocore makes a single attempt without a client-side limiter.
+    "textract": {
+        "read_timeout": 20,
+        "max_attempts": 1,
+        "retry_mode": "standard"
+    },
+    "lexv2-runtime": {
+        "read_timeout": 5
+    },
+    "connect": {
+        "read_timeout": 5
+    },
+    "s3": {
+        "read_timeout": 10,
+        "max_attempts": 5
+    },
+    "lambda": {
+        "read_timeout": 5
+    }
+}
+
+_clients = {}
+_lock = threading.Lock()
+_session = None
+
+
+def client_config(service_name):
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(SERVICE_SETTINGS.get(service_name, {}))
+    return Config(
+        connect_timeout=settings["connect_timeout"],
+        read_timeout=settings["read_timeout"],
+        max_pool_connections=settings["max_pool_connections"],
+        tcp_keepalive=True,
+        retries={
+            "mode": settings["retry_mode"],
+            "max_attempts": settings["max_attempts"]
+        }
+    )
+
+
+# Returns the container-wide client for a service, creating it on first use.
+# Clients are thread safe and keep their connection pool between warm invocations.
+def get_client(service_name):
+    global _session
+    client = _clients.get(service_name)
+    if client is None:
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                if _session is None:
+                    _session = boto3.session.Session()
+                logger.info('Creating %s client', service_name)
+                client = _session.client(service_name, config=client_config(service_name))
+                _clients[service_name] = client
+    return client
@@ -0,0 +1,46 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+import json
+import os
+
+# Document settings. Adjust as necessary.
+# Most documents evaluated per application. Prefetch and fulfillment both stop
+# here, so an upload of many URLs cannot start unbounded Textract work.
+MAX_DOCUMENTS = int(os.environ.get('MAX_DOCUMENTS', 4))
+
+
+# Document URLs of the application, in upload order without duplicates.
+# urlfile holds one URL or a JSON list of URLs, urlfiles a JSON list.
+def get_urlfiles(attributes):
+    urlfiles = []
+    for name in ('urlfile', 'urlfiles'):
+        urlfiles.extend(parse_urlfiles(attributes.get(name, None)))
+    return list(dict.fromkeys(urlfiles))
+
+
+def parse_urlfiles(value):
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [urlfile for urlfile in value if isinstance(urlfile, str) and urlfile]
+    value = value.strip()
+    if not value.startswith('['):
+        return [value]
+    try:
+        return [urlfile for urlfile in json.loads(value) if isinstance(urlfile, str) and urlfile]
+    except ValueError:
+        return []
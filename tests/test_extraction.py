@@ -0,0 +1,102 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+# Tests for the LINE fallback of extraction.
+# Run with: python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-bot-lambda'))
+
+import extraction
+
+
+def line(text, left, top, width=0.3, height=0.02):
+    return {
+        'BlockType': 'LINE',
+        'Text': text,
+        'Confidence': 99.0,
+        'Geometry': {'BoundingBox': {'Left': left, 'Top': top, 'Width': width, 'Height': height}}
+    }
+
+
+def page(*lines):
+    return {'Blocks': [{'BlockType': 'PAGE'}] + list(lines)}
+
+
+def fields(*names):
+    return [field for field in extraction.W2_PROFILE.fields if field.name in names]
+
+
+def extract(response, *names):
+    return extraction.extract_from_lines(response, fields(*names), extraction.W2_PROFILE.aliases)
+
+
+# Boxes 1 and 2 side by side: in reading order the wages value is the line
+# after the withholding label
+def test_value_must_be_below_the_label():
+    response = page(
+        line("1 Wages, tips, other compensation", 0.1, 0.2),
+        line("2 Federal income tax withheld", 0.5, 0.2),
+        line("48500.00", 0.1, 0.23),
+        line("5200.00", 0.5, 0.23))
+    values = extract(response, "federal_tax_withheld")
+    assert values["federal_tax_withheld"].value == 5200.0
+    assert values["federal_tax_withheld"].source == "line"
+
+
+def test_no_value_without_horizontal_overlap():
+    response = page(
+        line("2 Federal income tax withheld", 0.5, 0.2),
+        line("48500.00", 0.1, 0.23))
+    assert extract(response, "federal_tax_withheld") == {}
+
+
+def test_only_the_line_directly_below_counts():
+    response = page(
+        line("2 Federal income tax withheld", 0.5, 0.2),
+        line("Control number", 0.5, 0.23),
+        line("5200.00", 0.5, 0.26))
+    assert extract(response, "federal_tax_withheld") == {}
+
+
+def test_another_label_is_not_a_value():
+    response = page(
+        line("Wage and Tax Statement", 0.1, 0.1),
+        line("Tax year 2021", 0.1, 0.13))
+    values = extract(response, "tax_year")
+    assert values["tax_year"].key == "Tax year 2021"
+    response = page(
+        line("2 Federal income tax withheld", 0.5, 0.2),
+        line("1 Wages, tips, other compensation 48500.00", 0.5, 0.23))
+    assert extract(response, "federal_tax_withheld") == {}
+
+
+def test_value_on_the_label_line():
+    values = extract(page(line("Employer identification number 12-3456789", 0.1, 0.1)), "employer_ein")
+    assert values["employer_ein"].value == "12-3456789"
+
+
+def test_year_only_near_its_label():
+    response = page(
+        line("Wage and Tax Statement", 0.1, 0.1),
+        line("Copy B", 0.1, 0.13),
+        line("Issued 2019", 0.1, 0.5))
+    assert extract(response, "tax_year") == {}
+    response = page(
+        line("Wage and Tax Statement", 0.1, 0.1),
+        line("2021", 0.15, 0.13, width=0.05))
+    assert extract(response, "tax_year")["tax_year"].value == 2021
@@ -0,0 +1,148 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+# Tests for textract_guard against the offline StubTextract.
+# Tests for the asynchronous analysis path against the offline StubTextract.
+# Run with: python -m pytest tests
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-bot-lambda'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared-layer'))
+
+# textract_async reaches S3 through the shared client factory
+pytest.importorskip('boto3')
+
+import textract_async
+import textract_cache
+from textract_stub import StubTextract
+
+FEATURE_TYPES = ["FORMS"]
+
+
+def page_blocks(page, lines):
+    blocks = [{'BlockType': 'PAGE', 'Id': 'page-{}'.format(page), 'Confidence': 99.0}]
+    for line in range(lines):
+        blocks.append({'BlockType': 'LINE', 'Id': 'line-{}-{}'.format(page, line),
+            'Text': 'Line {} of page {}'.format(line, page), 'Confidence': 99.0})
+    return blocks
+
+
+def response(pages=2, lines=3):
+    blocks = []
+    for page in range(1, pages + 1):
+        blocks.extend(page_blocks(page, lines))
+    return {'DocumentMetadata': {'Pages': pages}, 'Blocks': blocks}
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def start_job(stub):
+    return textract_async.start_analysis(stub, {'Bucket': 'stub', 'Name': 'doc.pdf'}, FEATURE_TYPES, "digest")
+
+
+def test_polls_until_the_job_finishes():
+    clock = FakeClock()
+    stub = StubTextract(response(), in_progress_polls=3)
+    pages = list(textract_async.iter_analysis_pages(stub, start_job(stub), 100, clock.sleep, clock))
+    assert stub.calls.count('GetDocumentAnalysis') == 4
+    assert len(clock.sleeps) == 3
+    assert [block['Id'] for block in pages[0]['Blocks']] == [block['Id'] for block in response()['Blocks']]
+
+
+def test_backoff_is_jittered_and_capped():
+    clock = FakeClock()
+    stub = StubTextract(response(), in_progress_polls=12)
+    list(textract_async.iter_analysis_pages(stub, start_job(stub), 1000, clock.sleep, clock))
+    for attempt, delay in enumerate(clock.sleeps):
+        assert 0 <= delay <= min(textract_async.POLL_MAX_DELAY, textract_async.POLL_INITIAL_DELAY * (2 ** attempt))
+    assert len(set(clock.sleeps)) > 1
+
+
+def test_follows_next_token_paging():
+    clock = FakeClock()
+    document = response(pages=2, lines=3)
+    stub = StubTextract(document, in_progress_polls=0, page_size=3)
+    pages = list(textract_async.iter_analysis_pages(stub, start_job(stub), 100, clock.sleep, clock))
+    assert len(pages) == 3
+    assert all('NextToken' not in page for page in pages)
+    assert [block['Id'] for page in pages for block in page['Blocks']] == [block['Id'] for block in document['Blocks']]
+
+
+def test_job_still_running_at_deadline_times_out():
+    clock = FakeClock()
+    stub = StubTextract(response(), in_progress_polls=1000)
+    with pytest.raises(textract_async.AnalysisTimeout):
+        list(textract_async.iter_analysis_pages(stub, start_job(stub), 10, clock.sleep, clock))
+    assert clock.now <= 10
+
+
+def test_results_not_read_before_deadline_time_out():
+    clock = FakeClock()
+    stub = StubTextract(response(), in_progress_polls=0, page_size=2)
+    pages = textract_async.iter_analysis_pages(stub, start_job(stub), 10, clock.sleep, clock)
+    next(pages)
+    clock.now = 11
+    with pytest.raises(textract_async.AnalysisTimeout):
+        list(pages)
+
+
+def test_failed_job_raises():
+    clock = FakeClock()
+    stub = StubTextract(response(), in_progress_polls=0, job_status='FAILED')
+    with pytest.raises(textract_async.AnalysisFailed):
+        list(textract_async.iter_analysis_pages(stub, start_job(stub), 10, clock.sleep, clock))
+
+
+def test_result_pages_are_regrouped_by_document_page():
+    document = response(pages=3, lines=4)
+    # Result pages cut in the middle of document pages
+    blocks = document['Blocks']
+    results = [{'DocumentMetadata': document['DocumentMetadata'], 'Blocks': blocks[start:start + 4]}
+        for start in range(0, len(blocks), 4)]
+    pages = list(textract_async.iter_document_pages(results))
+    assert len(pages) == 3
+    for number, page in enumerate(pages, 1):
+        assert page['Blocks'][0]['Id'] == 'page-{}'.format(number)
+        assert len(page['Blocks']) == 5
+    assert pages[0]['DocumentMetadata'] == {'Pages': 3}
+    assert 'DocumentMetadata' not in pages[1]
+
+
+def test_pages_are_handed_over_before_the_last_result_page(monkeypatch):
+    monkeypatch.setattr(textract_cache, 'cache', textract_cache.TieredCache([textract_cache.MemoryBackend()]))
+    stub = StubTextract(response(pages=3, lines=4), in_progress_polls=0, page_size=5)
+    calls_at_page = []
+    pages = textract_cache.analyze_document(stub, b'%PDF-1.4 test document', FEATURE_TYPES,
+        on_page=lambda page: calls_at_page.append(len(stub.calls)))
+    assert len(pages) == 3
+    assert calls_at_page[0] < len(stub.calls)
+    # The stub stages nothing in S3
+    assert 'StartDocumentAnalysis' in stub.calls
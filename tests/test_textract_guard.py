@@ -0,0 +1,187 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+# Tests for textract_guard against the offline StubTextract.
+# Run with: python -m pytest tests
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-bot-lambda'))
+
+import textract_guard
+from textract_stub import StubClientError, StubTextract
+
+RESPONSE = {'Blocks': []}
+DOCUMENT = {'Bytes': b'document'}
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def guarded(stub, clock, threshold=2, open_seconds=30, rate=1000.0):
+    textract = textract_guard.GuardedTextract(
+        stub,
+        rates={"analyze_document": rate},
+        breaker=textract_guard.CircuitBreaker(threshold, open_seconds, clock=clock),
+        max_wait=0.5,
+        sleep=clock.sleep)
+    # Admission waits run on the fake clock too
+    textract.buckets["analyze_document"] = textract_guard.TokenBucket(rate, clock=clock)
+    return textract
+
+
+def analyze(textract):
+    return textract.analyze_document(Document=DOCUMENT, FeatureTypes=["FORMS"])
+
+
+def test_throttled_calls_are_retried():
+    clock = FakeClock()
+    stub = StubTextract(RESPONSE, throttle_calls=textract_guard.MAX_RETRIES)
+    textract = guarded(stub, clock)
+    assert analyze(textract) == RESPONSE
+    assert stub.throttled == textract_guard.MAX_RETRIES
+    assert textract.metrics.snapshot()["Retried"] == textract_guard.MAX_RETRIES
+    assert textract.breaker.state == "closed"
+
+
+def test_breaker_opens_and_recovers_through_a_trial_call():
+    clock = FakeClock()
+    # Every attempt of the first two calls is throttled
+    stub = StubTextract(RESPONSE, throttle_calls=2 * (textract_guard.MAX_RETRIES + 1))
+    textract = guarded(stub, clock, threshold=2, open_seconds=30)
+    for _ in range(2):
+        with pytest.raises(textract_guard.TextractUnavailable):
+            analyze(textract)
+    assert textract.breaker.state == "open"
+
+    calls = len(stub.calls)
+    with pytest.raises(textract_guard.CircuitOpen):
+        analyze(textract)
+    assert len(stub.calls) == calls
+
+    # Past the open period; the jittered retry sleeps left the clock fractional
+    clock.now += 31
+    assert textract.breaker.state == "half-open"
+    assert analyze(textract) == RESPONSE
+    assert textract.breaker.state == "closed"
+
+
+def test_failed_trial_reopens_the_breaker():
+    clock = FakeClock()
+    breaker = textract_guard.CircuitBreaker(threshold=1, open_seconds=10, clock=clock)
+    breaker.failure()
+    clock.now += 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+
+
+def test_rejected_trial_does_not_keep_the_breaker_open():
+    clock = FakeClock()
+    stub = StubTextract(RESPONSE)
+    textract = guarded(stub, clock, threshold=1, open_seconds=10, rate=1.0)
+    textract.breaker.failure()
+    clock.now += 10
+    # Empty the bucket so the trial call is not admitted
+    textract.buckets["analyze_document"]._tokens = 0.0
+    textract.buckets["analyze_document"]._updated = clock.now
+    textract.max_wait = 0.0
+    with pytest.raises(textract_guard.AdmissionRejected):
+        analyze(textract)
+    assert stub.calls == []
+
+    textract.max_wait = 2.0
+    assert analyze(textract) == RESPONSE
+    assert textract.breaker.state == "closed"
+
+
+def test_document_errors_do_not_trip_the_breaker():
+    clock = FakeClock()
+    stub = StubTextract(RESPONSE, throttle_calls=5, throttle_code='UnsupportedDocumentException')
+    textract = guarded(stub, clock, threshold=1)
+    with pytest.raises(textract_guard.DocumentRejected):
+        analyze(textract)
+    assert len(stub.calls) == 1
+    assert textract.breaker.state == "closed"
+
+
+def test_access_errors_count_as_failures():
+    clock = FakeClock()
+    stub = StubTextract(RESPONSE, throttle_calls=5, throttle_code='AccessDeniedException')
+    textract = guarded(stub, clock, threshold=2)
+    for _ in range(2):
+        with pytest.raises(textract_guard.TextractUnavailable):
+            analyze(textract)
+    assert textract.breaker.state == "open"
+    assert textract.metrics.snapshot()["Failed"] == 2
+
+
+def test_server_errors_are_not_retried():
+    clock = FakeClock()
+    stub = StubTextract(RESPONSE, throttle_calls=1, throttle_code='InternalServerError')
+    textract = guarded(stub, clock)
+    with pytest.raises(textract_guard.TextractUnavailable):
+        analyze(textract)
+    assert len(stub.calls) == 1
+
+
+def test_limit_halves_on_throttling_and_grows_on_success():
+    limit = textract_guard.AdaptiveLimit(initial=8, minimum=1, maximum=10)
+    assert limit.acquire(0)
+    limit.release(throttled=True)
+    assert limit.limit == 4
+    for _ in range(4):
+        assert limit.acquire(0)
+        limit.release()
+    assert 4.9 < limit.limit < 5.1
+    for _ in range(10):
+        assert limit.acquire(0)
+        limit.release(throttled=True)
+    assert limit.limit == 1
+
+
+def test_limit_rejects_calls_over_the_limit():
+    limit = textract_guard.AdaptiveLimit(initial=1, minimum=1, maximum=10)
+    assert limit.acquire(0)
+    assert not limit.acquire(0)
+    limit.release()
+    assert limit.acquire(0)
+
+
+def test_throttling_reduces_concurrency_limit():
+    clock = FakeClock()
+    stub = StubTextract(RESPONSE, throttle_calls=1)
+    textract = guarded(stub, clock)
+    before = textract.limit.limit
+    analyze(textract)
+    assert textract.limit.limit < before
+
+
+def test_stub_errors_carry_client_error_code():
+    error = StubClientError('ThrottlingException', 'AnalyzeDocument')
+    assert textract_guard.error_code(error) == 'ThrottlingException'
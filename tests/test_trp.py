@@ -0,0 +1,99 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+# Tests for the streaming reader and the binary format of trp.
+# Run with: python -m pytest tests
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-bot-lambda'))
+
+import trp
+
+BLOCKS = [
+    {'BlockType': 'PAGE', 'Id': 'p1'},
+    {'BlockType': 'LINE', 'Id': 'l1', 'Text': 'Empleador: José Müller — 12 345,67 €'},
+    {'BlockType': 'LINE', 'Id': 'l2', 'Text': '雇用主 株式会社'}
+]
+DATA = json.dumps({'DocumentMetadata': {'Pages': 1}, 'Blocks': BLOCKS}, ensure_ascii=False).encode('utf-8')
+
+
+# Returns at most one byte per read, whatever size was asked for
+class ShortReads:
+
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._stream.read(1)
+
+
+def test_short_reads_inside_multibyte_characters():
+    assert list(trp.iterJsonBlocks(ShortReads(DATA))) == BLOCKS
+
+
+def test_one_byte_chunks():
+    assert list(trp.iterJsonBlocks(io.BytesIO(DATA), chunkSize=1)) == BLOCKS
+
+
+DOCUMENT_BLOCKS = [
+    {'BlockType': 'PAGE', 'Id': 'p1', 'Relationships': [{'Type': 'CHILD', 'Ids': ['l1']}],
+        'Geometry': {'BoundingBox': {'Left': 0, 'Top': 0, 'Width': 1, 'Height': 1}, 'Polygon': []}},
+    {'BlockType': 'LINE', 'Id': 'l1', 'Text': 'Wages 48500.00', 'Confidence': 99.0, 'Page': 1,
+        'Geometry': {'BoundingBox': {'Left': 0.1, 'Top': 0.1, 'Width': 0.3, 'Height': 0.02},
+            'Polygon': [{'X': 0.1, 'Y': 0.1}]}}
+]
+
+
+def dumped():
+    fp = io.BytesIO()
+    trp.Document({'Blocks': DOCUMENT_BLOCKS}).dump(fp)
+    return fp.getvalue()
+
+
+def lines(doc):
+    return [line.text for line in doc.pages[0].lines]
+
+
+def test_load_from_file_and_stream(tmp_path):
+    path = tmp_path / 'doc.trpb'
+    path.write_bytes(dumped())
+    with open(str(path), 'rb') as fp:
+        assert lines(trp.Document.load(fp)) == ['Wages 48500.00']
+    assert lines(trp.Document.load(io.BytesIO(dumped()))) == ['Wages 48500.00']
+
+
+def test_load_from_file_position(tmp_path):
+    path = tmp_path / 'doc.bin'
+    path.write_bytes(b'prefix' + dumped())
+    with open(str(path), 'rb') as fp:
+        fp.seek(len(b'prefix'))
+        assert lines(trp.Document.load(fp)) == ['Wages 48500.00']
+
+
+@pytest.mark.parametrize('data', [b'', dumped()[:10], dumped()[:60]])
+def test_short_input_is_not_a_document(tmp_path, data):
+    path = tmp_path / 'doc.trpb'
+    path.write_bytes(data)
+    with open(str(path), 'rb') as fp:
+        with pytest.raises(ValueError, match='trp binary document'):
+            trp.Document.load(fp)
+    with pytest.raises(ValueError, match='trp binary document'):
+        trp.Document.load(io.BytesIO(data))
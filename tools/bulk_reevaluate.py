@@ -0,0 +1,283 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+# Replays archived loan applications through the bot's evaluation, for example
+# after a change to decision_rules.json.
+#
+# The manifest is JSONL or CSV with one application per record:
+#   id          unique application id (used for resume)
+#   loanAmount  requested amount
+#   loanType    auto, home or business (optional)
+#   document    path of the stored image or PDF, or
+#   textract    path of a stored Textract response (JSON)
+# Relative paths are resolved against the manifest's directory.
+#
+# A run can be interrupted and started again with the same arguments to
+# resume. Applications that ended in an error are evaluated again, so the
+# output can hold several rows for one id; the last one is current.
+#
+# Usage:
+#   python tools/bulk_reevaluate.py manifest.jsonl results.csv --workers 8 --cache-dir ./textract-cache
+#   python tools/bulk_reevaluate.py manifest.jsonl results.jsonl --textract stub --stub-response response.json
+#
+# --textract selects where analysis of stored documents comes from:
+#   cache  (default) responses already in a textract_cache disk directory, no AWS calls
+#   stub   every document answered with the response in --stub-response
+#   aws    the real Textract API through the bot's guarded client
+# The cache and stub modes never touch S3, PDFs included. A document Textract
+# could not analyze (throttling, an open circuit, a failed job, a cache miss)
+# is an error rather than a referral, so a resumed run retries it.
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-bot-lambda'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared-layer'))
+
+STAGES = ("read", "analyze", "parse", "decide")
+OUTPUT_FIELDS = ("id", "loanType", "loanAmount", "decision", "message", "error") + tuple(stage + "Ms" for stage in STAGES)
+REPORT_EVERY = 500
+
+
+class OfflineMiss(Exception):
+    pass
+
+
+# Textract client for the cache mode: every call is a cache miss
+class OfflineTextract:
+
+    def stage_document(self, imagebytes, digest, bucket=None):
+        raise OfflineMiss("Textract response not in the offline cache")
+
+    def analyze_document(self, **kwargs):
+        raise OfflineMiss("Textract response not in the offline cache")
+
+    def start_document_analysis(self, **kwargs):
+        raise OfflineMiss("Textract response not in the offline cache")
+
+
+_textract = None
+
+
+def init_worker(mode, cache_dir, stub_response, verbose):
+    global _textract
+    if not verbose:
+        # utils reports each step with print
+        sys.stdout = open(os.devnull, 'w')
+    if mode == "aws":
+        _textract = None
+        return
+
+    import textract_cache
+    backends = [textract_cache.MemoryBackend()]
+    if mode == "cache":
+        # Never expire or evict archived responses
+        backends.append(textract_cache.DiskBackend(cache_dir, max_bytes=float('inf'), ttl_seconds=float('inf')))
+    textract_cache.cache = textract_cache.TieredCache(backends)
+    if mode == "stub":
+        import textract_stub
+        _textract = textract_stub.StubTextract(stub_response, in_progress_polls=0)
+    else:
+        _textract = OfflineTextract()
+
+
+def evaluate_record(record):
+    import utils
+    timings = dict.fromkeys(STAGES, 0.0)
+    result = {
+        "id": record["id"],
+        "loanType": record.get("loanType", None),
+        "loanAmount": record["loanAmount"],
+        "decision": None,
+        "message": None,
+        "error": None
+    }
+    try:
+        amount = int(float(record["loanAmount"]))
+        loan_type = record.get("loanType", None) or None
+        start = time.perf_counter()
+        if record.get("textract", None):
+            with open(record["textract"], 'rt') as response_file:
+                response = json.load(response_file)
+            timings["read"] = time.perf_counter() - start
+            decision = utils.evaluate_response(response, amount, loan_type, timings)
+        else:
+            with open(record["document"], 'rb') as document_file:
+                imagebytes = document_file.read()
+            timings["read"] = time.perf_counter() - start
+            # Textract failures stay errors, so they are not checkpointed and a
+            # resumed run retries them
+            decision = utils.evaluate_loan(imagebytes, amount, loan_type=loan_type, textract=_textract, timings=timings,
+                refer_unavailable=False)
+        result["decision"] = decision["response"]
+        result["message"] = decision["body"]["message"]
+    except Exception as e:
+        result["error"] = "{}: {}".format(type(e).__name__, str(e))
+    for stage in STAGES:
+        result[stage + "Ms"] = round(timings[stage] * 1000, 2)
+    return result
+
+
+def read_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'rt', newline='') as manifest:
+        if path.endswith(".csv"):
+            records = csv.DictReader(manifest)
+        else:
+            records = (json.loads(line) for line in manifest if line.strip())
+        for record in records:
+            for field in ("document", "textract"):
+                if record.get(field, None):
+                    record[field] = os.path.join(base, record[field])
+            record["id"] = str(record["id"])
+            yield record
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'rt') as checkpoint:
+        return set(line.strip() for line in checkpoint if line.strip())
+
+
+# Writes results as they complete. The id of a successful record is added to
+# the checkpoint only after its result has been flushed, so a resumed run never
+# loses a result (at worst a result is repeated). Records that ended in an
+# error are not checkpointed, so a resumed run retries them.
+class ResultWriter:
+
+    def __init__(self, path, checkpoint_path):
+        self._csv = path.endswith(".csv")
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self._output = open(path, 'at', newline='')
+        self._checkpoint = open(checkpoint_path, 'at')
+        if self._csv:
+            self._writer = csv.DictWriter(self._output, fieldnames=OUTPUT_FIELDS)
+            if not exists:
+                self._writer.writeheader()
+
+    def write(self, result):
+        if self._csv:
+            self._writer.writerow(result)
+        else:
+            self._output.write(json.dumps(result) + "\n")
+        self._output.flush()
+        if not result["error"]:
+            self._checkpoint.write(result["id"] + "\n")
+            self._checkpoint.flush()
+
+    def close(self):
+        self._output.close()
+        self._checkpoint.close()
+
+
+class Report:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.count = 0
+        self.errors = 0
+        self.decisions = {}
+        self.stage_totals = dict.fromkeys(STAGES, 0.0)
+
+    def add(self, result):
+        self.count += 1
+        if result["error"]:
+            self.errors += 1
+        else:
+            self.decisions[result["decision"]] = self.decisions.get(result["decision"], 0) + 1
+        for stage in STAGES:
+            self.stage_totals[stage] += result[stage + "Ms"]
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        lines = ["{} documents in {:.1f}s, {:.1f} documents/s, {} errors".format(
+            self.count, elapsed, self.count / elapsed if elapsed else 0.0, self.errors)]
+        if self.count:
+            lines.append("mean stage time (ms): " + ", ".join(
+                "{} {:.1f}".format(stage, self.stage_totals[stage] / self.count) for stage in STAGES))
+        if self.decisions:
+            lines.append("decisions: " + ", ".join(
+                "{} {}".format(decision, count) for decision, count in sorted(self.decisions.items())))
+        return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-evaluate archived loan applications.")
+    parser.add_argument("manifest", help="JSONL or CSV list of applications")
+    parser.add_argument("output", help="results file, CSV if it ends in .csv, JSONL otherwise")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--checkpoint", help="successfully evaluated ids, default <output>.checkpoint")
+    parser.add_argument("--restart", action="store_true", help="ignore and replace an existing checkpoint and output")
+    parser.add_argument("--textract", choices=("cache", "stub", "aws"), default="cache")
+    parser.add_argument("--cache-dir", help="textract_cache disk directory with archived responses")
+    parser.add_argument("--stub-response", help="Textract response JSON answered by --textract stub")
+    parser.add_argument("--verbose", action="store_true", help="keep the evaluation output of the workers")
+    args = parser.parse_args(argv)
+
+    if args.textract == "stub" and not args.stub_response:
+        parser.error("--textract stub needs --stub-response")
+    if args.textract == "cache" and not args.cache_dir:
+        parser.error("--textract cache needs --cache-dir")
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+    if args.restart:
+        for path in (args.output, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    done = read_checkpoint(checkpoint_path)
+    if done:
+        print("Resuming, {} applications already evaluated".format(len(done)), file=sys.stderr)
+    pending = (record for record in read_manifest(args.manifest) if record["id"] not in done)
+
+    writer = ResultWriter(args.output, checkpoint_path)
+    report = Report()
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=init_worker,
+            initargs=(args.textract, args.cache_dir, args.stub_response, args.verbose)) as executor:
+        # Keep a bounded number of records in flight so large manifests are streamed
+        in_flight = set()
+        max_in_flight = args.workers * 4
+        try:
+            for record in pending:
+                in_flight.add(executor.submit(evaluate_record, record))
+                if len(in_flight) >= max_in_flight:
+                    finished, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    record_results(finished, writer, report)
+            record_results(concurrent.futures.as_completed(in_flight), writer, report)
+        finally:
+            writer.close()
+
+    print(report.summary(), file=sys.stderr)
+    return 1 if report.errors else 0
+
+
+def record_results(futures, writer, report):
+    for future in futures:
+        result = future.result()
+        writer.write(result)
+        report.add(result)
+        if report.count % REPORT_EVERY == 0:
+            print(report.summary().split("\n")[0], file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())